@@ -62,6 +62,8 @@ class DailyBot:
         self.agent_service = None
         self.content_extractor = None
         self.running = False
+        # 主协程任务：收到退出信号时取消它，使 run() 的 finally 能完成关闭流程（等待笔记落盘等）
+        self._main_task = None
         
     def load_config(self):
         """加载配置文件"""
@@ -134,7 +136,7 @@ class DailyBot:
             # 新的服务初始化流程
             # 1. 初始化内容提取器
             self.content_extractor = ContentExtractor(
-                config=self.config, llm_service=self.llm_service
+                config=self.config, llm_service=self.llm_service, note_manager=self.note_manager
             )
             logger.info("内容提取器初始化成功")
 
@@ -200,10 +202,14 @@ class DailyBot:
         self.running = False
         if self.channel:
             self.channel.shutdown()
-        sys.exit(0)
+        if self._main_task is not None and not self._main_task.done():
+            self._main_task.get_loop().call_soon_threadsafe(self._main_task.cancel)
+        else:
+            sys.exit(0)
     
     async def run(self):
         """运行应用"""
+        self._main_task = asyncio.current_task()
         # 设置信号处理
         signal.signal(signal.SIGINT, self.signal_handler)
         signal.signal(signal.SIGTERM, self.signal_handler)
@@ -241,15 +247,26 @@ class DailyBot:
             while self.running:
                 await asyncio.sleep(1)
                 
-        except KeyboardInterrupt:
+        except (KeyboardInterrupt, asyncio.CancelledError):
             logger.info("用户中断运行")
         except Exception as e:
             logger.error(f"运行时错误: {e}", exc_info=True)
         finally:
             if self.channel:
                 self.channel.shutdown()
+            await self._close_services()
             logger.info("程序退出")
 
+    async def _close_services(self):
+        """关闭各服务，等待尚未落盘的笔记写入完成"""
+        if self.note_manager:
+            try:
+                await asyncio.wait_for(self.note_manager.close(), timeout=30)
+            except asyncio.TimeoutError:
+                logger.error("等待笔记写入完成超时，剩余内容将在进程退出时尝试写入")
+            except Exception as e:
+                logger.error(f"关闭笔记管理器失败: {e}", exc_info=True)
+
     def _setup_logging(self):
         """配置Loguru日志系统"""
         logger.remove()
@@ -54,12 +54,15 @@ class HistoryProcessor:
             logger.error(f"加载历史处理状态文件失败: {e}", exc_info=True)
         return {}
 
-    def _save_state(self):
-        """保存处理状态"""
+    def _save_state(self, state: Optional[Dict[str, int]] = None):
+        """
+        保存处理状态。
+        在线程池中调用时应传入状态的快照，避免事件循环同时修改字典导致序列化出错。
+        """
         try:
             self.state_file.parent.mkdir(parents=True, exist_ok=True)
             with self.state_file.open('w', encoding='utf-8') as f:
-                json.dump(self.group_process_state, f, indent=4)
+                json.dump(self.group_process_state if state is None else state, f, indent=4)
         except Exception as e:
             logger.error(f"保存历史处理状态文件失败: {e}", exc_info=True)
 
@@ -79,7 +82,8 @@ class HistoryProcessor:
             start_time = datetime.now() - timedelta(days=self.max_history_days)
             start_timestamp = int(start_time.timestamp())
         
-        return mac_service.get_new_message_count_by_chatroom_id(group_id, start_timestamp)
+        # 数据库查询是阻塞I/O，放到线程池中执行，避免阻塞事件循环
+        return await asyncio.to_thread(mac_service.get_new_message_count_by_chatroom_id, group_id, start_timestamp)
 
     async def process_group_history_by_id(self, group_id: str, group_name: str) -> int:
         """
@@ -117,7 +121,7 @@ class HistoryProcessor:
                     last_msg_time = batch[-1].get('create_time')
                     if last_msg_time:
                         self.group_process_state[group_id] = last_msg_time
-                        self._save_state()
+                        await asyncio.to_thread(self._save_state, dict(self.group_process_state))
 
                 # 显示进度
                 progress = (i + len(batch)) / total_messages * 100
@@ -162,8 +166,8 @@ class HistoryProcessor:
                 start_timestamp = int(start_time.timestamp())
                 logger.info(f"群组 '{group_id}' 为首次处理，将获取过去 {self.max_history_days} 天的消息。")
 
-            # 调用服务层方法获取消息
-            messages = mac_service.get_messages_by_chatroom_id(group_id, start_timestamp)
+            # 调用服务层方法获取消息（读取并解析多个数据库，放到线程池中执行）
+            messages = await asyncio.to_thread(mac_service.get_messages_by_chatroom_id, group_id, start_timestamp)
 
             return messages
         except Exception as e:
@@ -24,6 +24,17 @@ from services.rag_service import RAGService
 from bot.history_processor import HistoryProcessor
 
 
+# 引用消息块，检测链接前先移除
+_REFERMSG_PATTERN = re.compile(r'<refermsg>.*?</refermsg>', re.DOTALL)
+
+# 消息中的链接：XML中 <url>/<title> 标签内的链接，或纯文本中的链接。
+# 两种形式合并为一个分支正则，每条消息只需一次 search
+_XML_LINK_PATTERN = r'<(?:url|title)>(?:<!\[CDATA\[)?(https?://\S+)(?:\]\]>)?</(?:url|title)>'
+# 纯文本链接取到空白、尖括号或引号为止
+_PLAIN_LINK_PATTERN = r'https?://[^\s<>"\']+'
+_MESSAGE_LINK_PATTERN = re.compile(f'(?P<xml>{_XML_LINK_PATTERN})|(?P<plain>{_PLAIN_LINK_PATTERN})')
+
+
 class MessageHandler:
     """消息处理器"""
     
@@ -110,24 +121,15 @@ class MessageHandler:
         Returns:
             是否包含链接
         """
-        if not text:
+        # 绝大多数消息不含 '://'，无需进入正则
+        if not text or '://' not in text:
             return False
 
         # 1. 移除引用消息，避免重复处理或错误解析
-        text_no_refer = re.sub(r'<refermsg>.*?</refermsg>', '', text, flags=re.DOTALL)
+        text_no_refer = _REFERMSG_PATTERN.sub('', text)
         
-        # 2. 检查XML中的常见链接标签
-        # 匹配 <url>...</url> 或 <title>...</title> 中包含的链接
-        xml_link_pattern = r'<(?:url|title)>(?:<!\[CDATA\[)?(https?://\S+)(?:\]\]>)?</(?:url|title)>'
-        if re.search(xml_link_pattern, text_no_refer):
-            return True
-            
-        # 3. 检查纯文本中的链接
-        plain_link_pattern = r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+'
-        if re.search(plain_link_pattern, text_no_refer):
-            return True
-
-        return False
+        # 2. 检查XML中的常见链接标签（<url>...</url> 或 <title>...</title>）及纯文本中的链接
+        return _MESSAGE_LINK_PATTERN.search(text_no_refer) is not None
     
     def save_message_from_context(self, context: Context):
         """
@@ -164,8 +166,8 @@ class MessageHandler:
     async def handle_text_message(self, context: Context) -> Optional[Reply]:
         """处理文本消息的总入口"""
         try:
-            # 0. 统一保存消息
-            self.save_message_from_context(context)
+            # 0. 统一保存消息（SQLite写入是阻塞I/O，放到线程池中执行，避免阻塞事件循环）
+            await asyncio.to_thread(self.save_message_from_context, context)
 
             # 1. 优先处理管理员命令
             if context.content.startswith("#") and self._is_admin(context.user_id):
@@ -193,7 +195,7 @@ class MessageHandler:
             logger.debug(f"在群聊 '{context.group_name}' 中发现纯文本链接，触发内容提取。")
             # 历史消息在这里被处理，直接提取内容，无需保存
             if not context.kwargs.get('is_historical'):
-                self.save_message_from_context(context)
+                await asyncio.to_thread(self.save_message_from_context, context)
             await self._extract_content(context)
 
     async def _handle_group_message(self, context: Context) -> Optional[Reply]:
@@ -247,7 +249,7 @@ class MessageHandler:
             # 历史消息在此处被处理，在下游的 _extract_content 中再进行判断和保存
             # 此处不再重复保存，避免因上下文不完整导致错误
             if not context.kwargs.get('is_historical'):
-                self.save_message_from_context(context)
+                await asyncio.to_thread(self.save_message_from_context, context)
             
             # 检查白名单
             if context.is_group and not self._is_in_whitelist(context):
@@ -347,7 +349,8 @@ class MessageHandler:
             elif not is_history:
                 extraction_config = self.config.get('content_extraction', {})
                 context_window = extraction_config.get('context_time_window', 60)
-                context_messages = self._get_context_messages(
+                context_messages = await asyncio.to_thread(
+                    self._get_context_messages,
                     int(time.time()),
                     context_window,
                     group_name=context.group_name if context.is_group else None
@@ -378,10 +381,7 @@ class MessageHandler:
             # 保存到笔记
             logger.info("内容提取成功，准备保存到笔记...")
             await self.note_manager.save_content(extracted_content)
-            
-            # 如果配置了RAG，更新向量数据库
-            if self.rag_service:
-                await self.rag_service.add_document(extracted_content)
+            # RAG采用实时检索，直接搜索笔记文件，保存后无需再为新内容生成嵌入向量或更新索引
 
             # 只有在所有步骤都成功后才记录成功日志
             log_title = extracted_content.get('structured_note', {}).get('title', '未知标题')
@@ -405,10 +405,12 @@ class MessageHandler:
         """
         # 从存储中获取消息
         logger.info(f"从数据库获取 {group_name or '私聊'} 在时间戳 {target_time} 前后 {window_seconds} 秒的上下文。")
+        # 上下文只用于拼接对话文本（读取 Text 和 CreateTime），无需读取和解析完整的原始消息
         results = self.message_storage.get_messages_in_time_window(
             target_time=target_time,
             window_seconds=window_seconds,
-            group_name=group_name
+            group_name=group_name,
+            return_raw=False
         )
         logger.info(f"获取到 {len(results)} 条消息 (时间窗口: {window_seconds}秒)")
         return results
@@ -430,7 +432,7 @@ class MessageHandler:
             # 如果启用了RAG
             if self.rag_service and self.config['rag']['enabled']:
                 # 使用RAG生成回复
-                reply = await self.rag_service.query(query)
+                reply = await self.rag_service.answer_question(query)
             else:
                 # 直接使用LLM生成回复
                 reply = await self.llm_service.chat(query)
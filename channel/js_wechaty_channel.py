@@ -7,7 +7,6 @@ JavaScript Wechaty Channel - 基于JS版wechaty的实现
 """
 
 import asyncio
-import json
 import os
 import time
 from typing import Dict, Any, Optional, List
@@ -19,6 +18,7 @@ from queue import Queue, Empty
 import random
 
 from channel.channel import Channel, Context, Reply, ReplyType
+from utils import json_utils
 
 
 class JSWechatyChannel(Channel):
@@ -76,7 +76,8 @@ class JSWechatyChannel(Channel):
     def on_ws_message(self, ws, message):
         """处理WebSocket消息"""
         try:
-            data = json.loads(message)
+            # 每条WebSocket消息都要解析一次，使用 json_utils（可用时走orjson）加快解析
+            data = json_utils.loads(message)
             msg_type = data.get('type')
             
             if msg_type == 'login':
@@ -121,7 +122,7 @@ class JSWechatyChannel(Channel):
                 'type': 'auth',
                 'token': self.token
             }
-            ws.send(json.dumps(auth_msg))
+            ws.send(json_utils.dumps(auth_msg))
     
     def connect(self):
         """连接到JS Wechaty服务"""
@@ -316,7 +317,7 @@ class JSWechatyChannel(Channel):
                 msg['payload']['path'] = reply.content
             
             # 发送消息
-            self.ws.send(json.dumps(msg))
+            self.ws.send(json_utils.dumps(msg))
             
         except Exception as e:
             logger.error(f"发送消息失败: {e}", exc_info=True)
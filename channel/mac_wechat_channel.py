@@ -19,6 +19,9 @@ from services.mac_wechat_service import MacWeChatService
 
 logger = logging.getLogger(__name__)
 
+# Hook模式群聊日志中发送者字段里括号内的昵称，例如 'wxid_xxxx@chatroom(小明)'
+_SENDER_NICKNAME_PATTERN = re.compile(r'\((.*?)\)')
+
 
 class MacWeChatChannel(Channel):
     """Mac微信通道，支持静默读取和Hook两种模式"""
@@ -246,7 +249,7 @@ class MacWeChatChannel(Channel):
             # 在Hook模式的群聊中，如果能从原始日志中解析出具体发言人，则使用
             if self.mode == 'hook' and message['is_group']:
                  # 示例：'wxid_xxxx@chatroom(小明)'
-                 match = re.search(r'\((.*?)\)', raw_message.get('from_user_id',''))
+                 match = _SENDER_NICKNAME_PATTERN.search(raw_message.get('from_user_id',''))
                  if match:
                      message['from_user_id'] = match.group(1) # 使用昵称作为发送者
 
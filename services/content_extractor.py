@@ -8,31 +8,67 @@
 import re
 import asyncio
 from datetime import datetime
+from functools import lru_cache
 from typing import Dict, Any, List, Optional, TYPE_CHECKING
 from loguru import logger
-import requests
 from bs4 import BeautifulSoup
 import aiohttp
-from playwright.async_api import async_playwright
 import html
+from urllib.parse import urlsplit
 
 # from utils.video_summarizer import BilibiliSummarizer
 
 # 仅在类型检查时导入，以避免循环导入
 if TYPE_CHECKING:
     from services.agent_service import AgentService
+    from services.note_manager import NoteManager
+
+
+# 从消息XML中提取链接
+_LINK_PATTERN = re.compile(r'https?://[^\s<>"\'`]+')
+
+# 消息XML中常见但无需处理的链接域名（头像、客服、小程序资源等），
+# 合并成一个正则分支，每个链接只需一次 search 即可判断是否命中任一域名
+_IGNORED_LINK_DOMAINS = ('wx.qlogo.cn', 'support.weixin.qq.com', 'wxapp.tc.qq.com')
+_IGNORED_LINK_PATTERN = re.compile('|'.join(
+    re.escape(domain) for domain in sorted(_IGNORED_LINK_DOMAINS, key=len, reverse=True)
+))
+
+# 需要特殊处理的链接来源，按域名（含其所有子域名）查表
+_LINK_SOURCE_BY_HOST = {
+    'mp.weixin.qq.com': 'wechat_article',
+    'bilibili.com': 'bilibili',
+    'b23.tv': 'bilibili',
+}
+
+
+@lru_cache(maxsize=4096)
+def _link_source(url: str) -> Optional[str]:
+    """
+    解析一次链接的域名，按域名及其上级域名查表判断链接来源；未知来源返回None。
+    只看域名而不是在整个URL里做子串匹配，查询参数中恰好出现的域名不会造成误判。
+    同一链接在一次提取中会被多次判断（是否B站、是否微信文章），结果按URL缓存。
+    """
+    host = (urlsplit(url).hostname or '').lower()
+    while host:
+        source = _LINK_SOURCE_BY_HOST.get(host)
+        if source:
+            return source
+        _, _, host = host.partition('.')
+    return None
 
 
 class ContentExtractor:
     """内容提取器，统一使用Jina AI Reader进行内容提取"""
 
-    def __init__(self, config: Dict[str, Any], llm_service):
+    def __init__(self, config: Dict[str, Any], llm_service, note_manager: Optional['NoteManager'] = None):
         """
         初始化内容提取器
         
         Args:
             config: 全局配置对象
             llm_service: LLM服务实例
+            note_manager: (可选) 笔记管理器，用于在抓取链接前按URL快速查重
         """
         self.config = config
         self.extraction_config = config.get('content_extraction', {})
@@ -40,6 +76,7 @@ class ContentExtractor:
         self.reader_base_url = "https://r.jina.ai/"
         self.jina_api_key = config.get('jina', {}).get('api_key')
         self.agent_service: Optional['AgentService'] = None
+        self.note_manager = note_manager
         logger.info("内容提取器初始化成功，将使用Jina AI Reader。")
 
     def set_message_handler(self, handler: Any):
@@ -63,14 +100,12 @@ class ContentExtractor:
         decoded_string = html.unescape(xml_string)
 
         # 2. 使用更健壮的正则表达式查找所有链接
-        link_pattern = re.compile(r'https?://[^\s<>"\'`]+')
-        all_links = link_pattern.findall(decoded_string)
+        all_links = _LINK_PATTERN.findall(decoded_string)
         
         # 3. 过滤掉常见的不需要处理的链接
-        ignored_domains = ['wx.qlogo.cn', 'support.weixin.qq.com', 'wxapp.tc.qq.com']
         filtered_links = [
             link for link in all_links 
-            if not any(domain in link for domain in ignored_domains)
+            if not _IGNORED_LINK_PATTERN.search(link)
         ]
 
         # 4. 去重并保持顺序
@@ -98,7 +133,7 @@ class ContentExtractor:
         # 增加日志，用于调试API Key是否正确加载
         logger.debug(f"Jina Reader 请求头: {headers}")
 
-        is_wechat_url = "mp.weixin.qq.com" in url
+        is_wechat_url = _link_source(url) == 'wechat_article'
         
         # Jina Reader的POST接口
         reader_post_url = "https://r.jina.ai/"
@@ -117,7 +152,9 @@ class ContentExtractor:
                     async with session.post(reader_post_url, json=payload, headers=headers, timeout=200) as response:
                         if response.status == 200:
                             json_response = await response.json()
-                            logger.debug(f"Jina Reader (POST) 响应: {json_response}")
+                            # 响应中包含整篇正文：以参数形式传给 loguru，只有启用DEBUG输出时才会格式化，
+                            # 避免每次请求都把整个响应字典转换成字符串后再丢弃
+                            logger.debug("Jina Reader (POST) 响应: {}", json_response)
                             # 修正：从 'data' 字段中提取内容
                             data = json_response.get('data', {})
                             return {'title': data.get('title', url), 'content': data.get('content', '')}
@@ -130,7 +167,7 @@ class ContentExtractor:
                     async with session.get(reader_get_url, headers=headers, timeout=200) as response:
                         if response.status == 200:
                             json_response = await response.json()
-                            logger.debug(f"Jina Reader (GET) 响应: {json_response}")
+                            logger.debug("Jina Reader (GET) 响应: {}", json_response)
                             # 修正：从 'data' 字段中提取内容
                             data = json_response.get('data', {})
                             return {'title': data.get('title', url), 'content': data.get('content', '')}
@@ -236,7 +273,12 @@ class ContentExtractor:
                 
                 url = links[0]
 
-                is_bilibili = 'b23.tv' in url or 'bilibili.com' in url or '<appname>哔哩哔哩</appname>' in xml_string
+                # 抓取网页和调用LLM之前先按URL做一次快速查重，已保存过的链接直接跳过
+                if self.note_manager and await self.note_manager.is_url_saved(url):
+                    logger.info(f"链接已保存在笔记中，跳过提取: {url}")
+                    return None
+
+                is_bilibili = _link_source(url) == 'bilibili' or '<appname>哔哩哔哩</appname>' in xml_string
                 if is_bilibili:
                     logger.info(f"检测到Bilibili链接，使用专用抓取器: {url}")
                     content_info = await self._fetch_bilibili_content_from_web(url)
@@ -254,6 +296,12 @@ class ContentExtractor:
             
             logger.info(f"成功从 {url} 提取到内容，标题: '{content_info.get('title', '')}'")
 
+            # 只截取一次后续流程真正会用到的前缀：Agent生成笔记时最多使用正文前15000个字符，
+            # 提前截断可以避免把超长网页正文在决策、搜索补充和结果字典之间反复传递和拷贝。
+            # 长度未超限时切片直接返回原对象，不产生拷贝
+            max_raw_length = self.extraction_config.get('max_raw_content_length', 15000)
+            raw_content = content_info['content'][:max_raw_length]
+
             # 使用LLM生成自然的对话上下文
             conversation_context = await self._build_context_with_llm(msg, context_messages)
 
@@ -261,7 +309,7 @@ class ContentExtractor:
             if self.agent_service:
                 # 调用Agent Service处理从决策到生成结构化笔记的完整流程
                 structured_note = await self.agent_service.process_content_to_note(
-                    original_content=content_info['content'],
+                    original_content=raw_content,
                     conversation_context=conversation_context
                 )
                 # 如果Agent判断内容不相关，则中止流程
@@ -278,7 +326,7 @@ class ContentExtractor:
                 'url': url,
                 'structured_note': structured_note.dict(), # 将pydantic模型转为字典
                 'context': conversation_context,
-                'raw_content': content_info['content'],
+                'raw_content': raw_content,
                 'extracted_at': datetime.now(),
                 'source_user': msg.get('User', {}).get('NickName', '未知')
             }
@@ -72,7 +72,7 @@ class GoogleDocsManager:
             return None
     
     async def execute_save(self, document_id: str, content_data: Dict[str, Any], 
-                           insert_location: Dict[str, Any], document: Optional[Dict[str, Any]] = None):
+                           insert_location: Dict[str, Any], doc_structure: Optional[Dict[str, Any]] = None):
         """
         将内容和格式化请求转换为Google Docs API调用。
 
@@ -80,22 +80,12 @@ class GoogleDocsManager:
             document_id: 要保存到的文档ID
             content_data: 包含'structured_note'和'url'的内容数据
             insert_location: 包含插入位置和操作指令的字典
-            document: (可选) 预加载的文档对象，避免重复请求
+            doc_structure: (可选) 调用方已获取的文档结构，插入位置已据此算好，这里无需再次请求文档
         """
         logger.info(f"开始执行Google Docs API调用, 目标文档ID: {document_id}")
 
-        # 如果没有提供预加载的文档，需要先获取它以进行查重
-        doc_to_check = document
-        if not doc_to_check:
-            doc_to_check = await self.get_document_content(document_id)
-            if not doc_to_check:
-                logger.error(f"无法获取文档 {document_id} 以检查重复项，取消保存。")
-                return
-
-        if await self.is_duplicate_in_document(self.config, content_data):
-            log_title = content_data.get('structured_note', {}).get('title', '未知标题')
-            logger.info(f"内容 '{log_title}' 已存在于文档中，跳过保存。")
-            return
+        # 查重已由调用方（NoteManager.save_content 的全局查重）在保存前完成，
+        # 这里不再为了重复查重而额外请求一次整篇文档
 
         try:
             requests = []
@@ -250,11 +240,11 @@ class GoogleDocsManager:
     
     def _extract_text_from_paragraph(self, paragraph: Dict[str, Any]) -> str:
         """从段落元素中提取文本"""
-        text = ""
-        for element in paragraph.get('elements', []):
-            if 'textRun' in element:
-                text += element['textRun'].get('content', '')
-        return text.strip()
+        return ''.join(
+            element['textRun'].get('content', '')
+            for element in paragraph.get('elements', [])
+            if 'textRun' in element
+        ).strip()
     
     async def is_duplicate_in_document(self, doc_config: Dict[str, Any], content_data: Dict[str, Any]) -> bool:
         """
@@ -283,34 +273,34 @@ class GoogleDocsManager:
             return False
 
         content = document.get('body', {}).get('content', [])
-        doc_text = self._get_document_text(document)
-        
-        if title_to_check and title_to_check in doc_text:
-            logger.debug(f"在文档 '{doc_config.get('name')}' 中发现疑似重复内容（标题匹配）: '{title_to_check}'")
-            return True
-            
-        if url_to_check:
-            for element in content:
-                if 'paragraph' in element:
-                    for para_element in element.get('paragraph', {}).get('elements', []):
-                        if 'textRun' in para_element:
-                            text_style = para_element.get('textRun', {}).get('textStyle', {})
-                            if 'link' in text_style and text_style['link'].get('url') == url_to_check:
-                                logger.debug(f"在文档 '{doc_config.get('name')}' 中发现重复内容（URL匹配）: '{url_to_check}'")
-                                return True
+
+        # 单趟遍历所有段落，同时检查标题文本和链接，命中即返回；
+        # 不再先拼接整篇文档文本再做第二遍链接扫描
+        for element in content:
+            paragraph = element.get('paragraph')
+            if not paragraph:
+                continue
+            if title_to_check and title_to_check in self._extract_text_from_paragraph(paragraph):
+                logger.debug(f"在文档 '{doc_config.get('name')}' 中发现疑似重复内容（标题匹配）: '{title_to_check}'")
+                return True
+            if url_to_check:
+                for para_element in paragraph.get('elements', []):
+                    link = para_element.get('textRun', {}).get('textStyle', {}).get('link')
+                    if link and link.get('url') == url_to_check:
+                        logger.debug(f"在文档 '{doc_config.get('name')}' 中发现重复内容（URL匹配）: '{url_to_check}'")
+                        return True
         
         return False
 
     def _get_document_text(self, document: Dict[str, Any]) -> str:
         """获取文档的纯文本内容"""
-        text = ""
         content = document.get('body', {}).get('content', [])
-        
-        for element in content:
-            if 'paragraph' in element:
-                text += self._extract_text_from_paragraph(element['paragraph']) + '\n'
-        
-        return text
+        # 收集各段落后一次性拼接，避免逐段 += 产生的重复拷贝
+        return ''.join(
+            self._extract_text_from_paragraph(element['paragraph']) + '\n'
+            for element in content
+            if 'paragraph' in element
+        )
     
     async def get_document_text(self, doc_config: Dict[str, Any]) -> Optional[str]:
         """
@@ -9,7 +9,7 @@ import sqlite3
 import subprocess
 import logging
 from pathlib import Path
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Iterator
 from datetime import datetime
 import shutil
 from pysqlcipher3 import dbapi2 as sqlcipher
@@ -26,6 +26,34 @@ SQLCIPHER3_DEFAULTS_CONFIG = [
     "PRAGMA cipher_kdf_algorithm = PBKDF2_HMAC_SHA1;"
 ]
 
+# 按行/按消息调用的正则，模块加载时编译一次
+_DB_KEY_PATTERN = re.compile(r"^[0-9a-fA-F]{64}$")
+# 群聊消息内容的发言人前缀，格式: wxid_xxxx:\n{content}
+_GROUP_SENDER_PATTERN = re.compile(r"^(wxid_[a-zA-Z0-9]+):\n")
+
+def _iter_dirs_named(root: Path, name: str) -> Iterator[Path]:
+    """
+    以深度优先顺序遍历 root 下所有名为 name 的子目录。
+    使用显式栈 + os.scandir 代替 Path.rglob：scandir 在读取目录项时已带回文件类型，
+    判断是否为目录无需额外的 stat 调用，也不必为每个目录项都构造 Path 对象。
+    与 rglob 一样，不会跟随指向目录的符号链接。
+    """
+    stack = [str(root)]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                subdirs = [entry for entry in it if entry.is_dir(follow_symlinks=False)]
+        except OSError:
+            # 无权限或目录在遍历过程中被删除，跳过即可
+            continue
+        for entry in subdirs:
+            if entry.name == name:
+                yield Path(entry.path)
+        # 逆序压栈，保证按目录项原有顺序进行深度优先遍历
+        stack.extend(entry.path for entry in reversed(subdirs))
+
+
 class DBManager:
     """封装对单个解密后数据库的查询操作"""
     def __init__(self, db_path: Path):
@@ -69,7 +97,7 @@ class MacWeChatHook:
 
     def _get_db_key_from_env(self) -> str:
         key = os.getenv("WECHAT_DB_KEY")
-        if not key or len(key) != 64 or not re.match(r"^[0-9a-fA-F]{64}$", key):
+        if not key or len(key) != 64 or not _DB_KEY_PATTERN.match(key):
             raise ValueError("环境变量 WECHAT_DB_KEY 未设置或格式不正确。")
         logger.info("成功从环境变量加载数据库密钥。")
         return key
@@ -93,8 +121,8 @@ class MacWeChatHook:
             return None
 
     def find_user_data_path(self) -> Optional[Path]:
-        for msg_dir in self.db_base_path.rglob("Message"):
-            if msg_dir.is_dir() and (msg_dir.parent / "Contact").exists():
+        for msg_dir in _iter_dirs_named(self.db_base_path, "Message"):
+            if (msg_dir.parent / "Contact").exists():
                 logger.info(f"找到有效的用户数据目录: {msg_dir.parent}")
                 return msg_dir.parent
         logger.error("未找到有效的用户数据目录。")
@@ -236,7 +264,7 @@ class MacWeChatHook:
                 if is_group and content and '<sysmsg' not in content:
                     # 解析群聊中的发言人
                     # 格式: wxid_xxxx:\n{content}
-                    match = re.match(r"^(wxid_[a-zA-Z0-9]+):\n", content)
+                    match = _GROUP_SENDER_PATTERN.match(content)
                     if match:
                         sender = match.group(1)
                         content = content[match.end():]
@@ -11,14 +11,29 @@ from datetime import datetime, timedelta
 import subprocess
 import time
 from threading import Thread, Lock
+from concurrent.futures import ThreadPoolExecutor
 import json
 import re
 import hashlib
+from functools import lru_cache
 
 from services.mac_wechat_hook import MacWeChatHook, DBManager
 
 logger = logging.getLogger(__name__)
 
+# WeChatTweak 日志行和群聊ID的解析正则，监控日志时逐行使用，模块加载时编译一次
+_TWEAK_LOG_LINE_PATTERN = re.compile(r'\[Message\]\s+(.*?)\((.*?)\):\s*(.*)')
+_CHATROOM_ID_PATTERN = re.compile(r'([a-zA-Z0-9_-]+@chatroom)')
+
+
+@lru_cache(maxsize=1024)
+def _chat_table_name(chatroom_id: str) -> str:
+    """
+    根据群聊ID计算Mac微信消息库中的聊天表名（Chat_ + ID的MD5）。
+    这里必须使用MD5，因为表名格式由微信客户端决定；轮询新消息时会对同一群聊反复计算，因此缓存结果。
+    """
+    return f"Chat_{hashlib.md5(chatroom_id.encode()).hexdigest()}"
+
 
 class MacWeChatService:
     """Mac微信服务，封装数据库解密、读取和Hook操作"""
@@ -59,7 +74,16 @@ class MacWeChatService:
 
             # 动态扫描并解密所有消息数据库
             message_dir = user_path / "Message"
-            msg_db_files = sorted(message_dir.glob("msg_*.db"))
+            # 用 os.scandir 读取目录项并按文件名筛选：目录项自带文件类型，
+            # 判断是否为普通文件不需要额外的 stat，也不必经过 glob 的模式匹配
+            try:
+                with os.scandir(message_dir) as it:
+                    msg_db_files = sorted(
+                        Path(entry.path) for entry in it
+                        if entry.name.startswith("msg_") and entry.name.endswith(".db") and entry.is_file()
+                    )
+            except FileNotFoundError:
+                msg_db_files = []
             logger.info(f"在 {message_dir} 中发现 {len(msg_db_files)} 个消息数据库文件，开始解密...")
 
             for db_path in msg_db_files:
@@ -228,6 +252,19 @@ class MacWeChatService:
                 return contact['nickname']
         return None
 
+    def _query_msg_dbs(self, query: str, params=()) -> List[Optional[List]]:
+        """
+        在所有消息库上执行同一条查询，按消息库顺序返回各自的结果。
+        消息被微信分散存放在多个 msg_*.db 文件中，查询以磁盘I/O为主，
+        用线程池并行查询各个库，而不是一个接一个地顺序查询。
+        DBManager 每次查询都会新建自己的连接，因此可以安全地在多个线程中调用。
+        """
+        if len(self.msg_db_managers) <= 1:
+            return [db_manager.execute_query(query, params) for db_manager in self.msg_db_managers]
+        max_workers = min(len(self.msg_db_managers), self.config.get('db_query_workers', 8))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(lambda db_manager: db_manager.execute_query(query, params), self.msg_db_managers))
+
     def get_messages_by_chatroom(self, chatroom_name: str, start_timestamp: int = 0) -> List[Dict[str, Any]]:
         if not self.msg_db_managers:
             logger.error("数据库未初始化。")
@@ -244,14 +281,14 @@ class MacWeChatService:
              return []
 
         all_messages = []
-        table_name = f"Chat_{hashlib.md5(chatroom_id.encode()).hexdigest()}"
+        table_name = _chat_table_name(chatroom_id)
         
-        for db_manager in self.msg_db_managers:
-             # 直接查询已知的表
-            rows = db_manager.execute_query(
-                f"SELECT mesLocalID, msgCreateTime, msgContent, mesDes, msgSource, messageType FROM {table_name} WHERE msgCreateTime > ?",
-                (start_timestamp,)
-            )
+        # 直接查询已知的表；各个消息库相互独立，并行查询
+        all_rows = self._query_msg_dbs(
+            f"SELECT mesLocalID, msgCreateTime, msgContent, mesDes, msgSource, messageType FROM {table_name} WHERE msgCreateTime > ?",
+            (start_timestamp,)
+        )
+        for rows in all_rows:
             if not rows: continue
 
             for row in rows:
@@ -281,14 +318,14 @@ class MacWeChatService:
             return []
         
         all_messages = []
-        table_name = f"Chat_{hashlib.md5(chatroom_id.encode()).hexdigest()}"
+        table_name = _chat_table_name(chatroom_id)
         
-        for db_manager in self.msg_db_managers:
-             # 直接查询已知的表
-            rows = db_manager.execute_query(
-                f"SELECT mesLocalID, msgCreateTime, msgContent, mesDes, msgSource, messageType FROM {table_name} WHERE msgCreateTime > ?",
-                (start_timestamp,)
-            )
+        # 直接查询已知的表；各个消息库相互独立，并行查询
+        all_rows = self._query_msg_dbs(
+            f"SELECT mesLocalID, msgCreateTime, msgContent, mesDes, msgSource, messageType FROM {table_name} WHERE msgCreateTime > ?",
+            (start_timestamp,)
+        )
+        for rows in all_rows:
             if not rows: continue
 
             for row in rows:
@@ -316,7 +353,7 @@ class MacWeChatService:
             return 0
             
         total_count = 0
-        table_name = f"Chat_{hashlib.md5(chatroom_id.encode()).hexdigest()}"
+        table_name = _chat_table_name(chatroom_id)
         
         for db_manager in self.msg_db_managers:
             rows = db_manager.execute_query(
@@ -493,7 +530,7 @@ sendMessage("{to_user}", "{escaped_content}")
         """解析单行日志并调用处理器"""
         # WeChatTweak 日志格式示例:
         # 2024-07-30 15:30:00.123 [WeChatTweak] [Message] wxid_xxxx@chatroom(小明): 大家好
-        match = re.search(r'\[Message\]\s+(.*?)\((.*?)\):\s*(.*)', line)
+        match = _TWEAK_LOG_LINE_PATTERN.search(line)
         if match:
             full_user, nickname, content = match.groups()
             
@@ -569,7 +606,7 @@ sendMessage("{to_user}", "{escaped_content}")
                     rows = db_manager.execute_query(f'SELECT msgContent FROM "{table_name}" WHERE msgContent LIKE "%@chatroom%" LIMIT 10')
                     for row in rows:
                         content = row[0]
-                        match = re.search(r'([a-zA-Z0-9_-]+@chatroom)', content)
+                        match = _CHATROOM_ID_PATTERN.search(content)
                         if match:
                             group_id = match.group(1)
                             if group_id in group_ids and group_id not in self._group_id_to_table_map:
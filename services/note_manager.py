@@ -6,13 +6,104 @@
 """
 
 import re
-import json
-from typing import Dict, Any, List, Optional, Literal
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple, Literal
 from loguru import logger
 from pydantic import BaseModel, Field
 
 from services.google_docs_manager import GoogleDocsManager
 from services.obsidian_manager import ObsidianManager
+from utils import json_utils
+
+
+# 搜索和文件选择路径上使用的正则，模块加载时编译一次
+_FILE_INDEX_PATTERN = re.compile(r'\d+')
+# 每个条目以加粗的日期标题开始
+_ENTRY_SPLIT_PATTERN = re.compile(r'\n(?=\*\*[0-9])')
+_METADATA_PATTERN = re.compile(r'<!-- metadata: (.*) -->')
+_BOLD_TITLE_PATTERN = re.compile(r'\*\*(.*?)\*\*')
+
+# LLM选择笔记文件结果缓存的最大条目数
+_FILE_SELECTION_CACHE_SIZE = 512
+# 目录树各层级（Markdown/Google Docs 标题最多6级）的缩进，避免每行重新拼接缩进字符串
+_TREE_INDENTS = tuple("  " * i for i in range(6))
+# 关键词路由用：连续的字母/数字/汉字片段
+_WORD_CHUNK_PATTERN = re.compile(r'\w+')
+
+
+def _keyword_set(text: str) -> set:
+    """
+    把文本切分为用于关键词路由的词集合：英文等ASCII片段按整词，
+    中文等非ASCII片段没有空格分词，按相邻两个字的二元组。
+    """
+    keywords = set()
+    for chunk in _WORD_CHUNK_PATTERN.findall(text.lower()):
+        if chunk.isascii():
+            if len(chunk) > 1:
+                keywords.add(chunk)
+        else:
+            keywords.update(chunk[i:i + 2] for i in range(len(chunk) - 1))
+    return keywords
+
+
+# 插入位置决策的各分类策略说明与提示词模板，进程内不变，模块加载时构建一次
+_STRATEGY_INSTRUCTIONS = {
+    "cautious_filer": """
+# Role: 你是一位极其谨慎的档案管理员，首要任务是避免错误分类。
+
+1.  **第一优先级 (insert_into_miscellaneous)**: 这是你的默认和首选操作。除非满足下一条的**严格**条件，否则总是将内容放入最相关父标题下的"其他"分类中。
+2.  **第二优先级 (insert_under_leaf)**: 只有当新内容的主题与某个"叶子节点"的标题**完全一致或主题高度重合**时，才允许你将内容放入该叶子节点下。如果你有任何一丝犹豫，就退回使用第一优先级。
+3.  **第三优先级 (create_new_subheading)**: **（严格禁止）** 绝对不要创建新的子标题。
+""",
+    "diligent_categorizer": """
+# Role: 你是一位勤奋的图书管理员，目标是尽可能地将每一份资料都精准归档到现有的分类中。
+
+1.  **第一优先级 (insert_under_leaf)**: 请尽你最大的努力，在"叶子节点列表"中寻找一个**最相关**的现有标题，即使主题不是100%完全匹配，只要它是最合理的归宿即可。这是你的首要目标。
+2.  **第二优先级 (insert_into_miscellaneous)**: 仅当你在所有叶子节点中都**找不到任何一个**合适的归宿时，才允许将内容放入相关父标题的"其他"分类中。
+3.  **第三优先级 (create_new_subheading)**: **（几乎不用）** 只有在内容与所有现有分类都完全无关，且确实需要一个全新分类时，才考虑此选项。
+""",
+    "balanced": """
+# Role: 你是一位经验丰富的图书管理员，追求效率和结构之间的平衡。
+
+1.  **第一优先级 (insert_under_leaf)**: 检查新内容是否与"叶子节点列表"中的某个标题主题**高度匹配**。如果是，这是最优先的选择。
+2.  **第二优先级 (insert_into_miscellaneous)**: 如果找不到高度匹配的叶子，将内容放入最相关父标题的"其他"分类中，这是一个安全的选择。
+3.  **第三优先级 (create_new_subheading)**: 如果内容确实代表了一个在父标题下非常重要且**缺失**的子分类，可以创建一个新的子标题来优化结构。请不要轻易使用此选项。
+""",
+    "aggressive": """
+# Role: 你是一位富有远见的架构师，目标是主动构建和优化知识库的结构。
+
+1.  **第一优先级 (create_new_subheading)**: 新内容是否可以作为一个现有标题下的、逻辑清晰的**新子分类**？如果是，请大胆地创建新子标题，这是丰富文档结构的最佳方式。
+2.  **第二优先级 (insert_under_leaf)**: 如果无法创建有意义的新子标题，再检查内容是否与某个已有的"叶子节点"**高度匹配**。
+3.  **第三优先级 (insert_into_miscellaneous)**: 仅当内容与整个文档结构都无关时，才使用此选项。
+"""
+}
+
+_INSERTION_PROMPT_TEMPLATE = """
+你是一位图书管理员，你的任务是根据一份现有文档的目录结构，将一份新内容精准地归类。
+你的行为模式由你的角色决定，请严格遵循。
+
+{instructions}
+
+[文档现有目录结构]
+```
+{tree}
+```
+
+[可供直接归类的叶子节点列表]
+{leaves}
+
+[待插入的新内容]
+- 标题: {title}
+- 摘要: {summary}
+
+[注意]
+- **禁止创建新的一级标题**，除非文档完全为空。
+- 你的目标是维护一个整洁、有序的笔记结构，而不是随意扩张。
+
+请仔细思考并用中文解释你的决策过程，然后做出最终决策。
+"""
 
 
 class InsertionDecision(BaseModel):
@@ -43,6 +134,14 @@ class NoteManager:
         self.note_backend_name = config.get('note_backend', 'obsidian')
         self.backend_manager = None
         self.llm_service = None
+        # Obsidian文档的条目切分缓存: {文档名: 缓存}，文档内容变化时自动重建
+        self._search_index_cache: Dict[str, Dict[str, Any]] = {}
+        # Google Docs文档的小写文本与段落缓存: {文档名: 缓存}，文档内容变化时自动重建
+        self._gdocs_search_cache: Dict[str, Dict[str, Any]] = {}
+        # 最近一次计算插入位置时使用的 (headings 列表, 标题对象id -> 下标) 映射
+        self._heading_positions_cache: Optional[Tuple[List[Dict[str, Any]], Dict[int, int]]] = None
+        # LLM选择笔记文件的结果缓存: {内容键: 文件下标}，按LRU淘汰
+        self._file_selection_cache: "OrderedDict[str, int]" = OrderedDict()
 
         if self.note_backend_name == 'obsidian':
             obsidian_config = config.get('obsidian', {})
@@ -55,6 +154,20 @@ class NoteManager:
         else:
             raise ValueError(f"不支持的笔记后端: {self.note_backend_name}")
 
+        # 关键词路由：内容与某个文件描述的相似度明显高于其他文件时（最高分超过第二名的该倍数），
+        # 直接选择该文件而不调用LLM。默认 0 表示关闭，始终由LLM选择
+        note_management_config = config.get('note_management', {})
+        self.llm_routing_threshold = float(note_management_config.get('llm_routing_threshold', 0) or 0)
+        if 0 < self.llm_routing_threshold < 1:
+            # 倍数小于1时，得分不如第二名的文件也会被选中，没有意义
+            logger.warning(f"llm_routing_threshold={self.llm_routing_threshold} 小于1，已按1处理。")
+            self.llm_routing_threshold = 1.0
+        # 关键词路由至少需要与文件描述共有的关键词数量，避免仅凭一两个常见词就跳过LLM
+        self.llm_routing_min_overlap = int(note_management_config.get('llm_routing_min_overlap', 3))
+        self._note_file_keywords = [
+            _keyword_set(f"{f.get('name', '')} {f.get('description', '')}") for f in self.note_files_config
+        ]
+
         logger.info(f"笔记管理器初始化成功，使用后端: {self.note_backend_name}")
     
     def set_llm_service(self, llm_service: Any):
@@ -66,6 +179,12 @@ class NoteManager:
             self.backend_manager.set_llm_service(llm_service)
             logger.info(f"LLM服务已成功注入到 {self.note_backend_name} 管理器。")
     
+    async def close(self):
+        """关闭笔记管理器，等待后端尚未落盘的写入完成。"""
+        flush = getattr(self.backend_manager, 'flush', None)
+        if flush is not None:
+            await flush()
+
     async def save_content(self, content_data: Dict[str, Any]):
         """
         将提取的内容路由到相应的后端管理器进行保存。
@@ -125,7 +244,7 @@ class NoteManager:
                 doc_id_or_path, 
                 content_data, 
                 insert_location,
-                document=doc_structure.get('raw_document') # 传递预加载的文档以优化
+                doc_structure=doc_structure # 传递已获取的文档结构，后端无需再次解析
             )
 
         except Exception as e:
@@ -144,6 +263,23 @@ class NoteManager:
         title = content_data.get('structured_note', {}).get('title', '')
         summary = content_data.get('structured_note', {}).get('gist', '')
 
+        # 相同标题和摘要的内容（例如不同链接转发的同一篇文章）直接复用上次的选择，省去一次LLM调用。
+        # 只缓存文件选择：文件内的插入位置依赖随时变化的文档结构，不能缓存。
+        cache_key = hashlib.blake2b(f"{title}\0{summary[:200]}".encode('utf-8'), digest_size=16).hexdigest()
+        cached_idx = self._file_selection_cache.get(cache_key)
+        if cached_idx is not None and cached_idx < len(self.note_files_config):
+            self._file_selection_cache.move_to_end(cache_key)
+            selected_doc = self.note_files_config[cached_idx]
+            logger.info(f"命中文件选择缓存，选择文件: '{selected_doc.get('name')}'")
+            return selected_doc
+
+        if self.llm_routing_threshold > 0:
+            routed_idx = self._route_by_keywords(f"{title} {summary}")
+            if routed_idx is not None:
+                selected_doc = self.note_files_config[routed_idx]
+                logger.info(f"内容与文件描述的关键词明显匹配，直接选择文件: '{selected_doc.get('name')}'")
+                return selected_doc
+
         options_str = "\n".join([
             f"{i+1}. 文件名: {f.get('name', '未命名')}\n   描述: {f.get('description', '无描述')}"
             for i, f in enumerate(self.note_files_config)
@@ -169,11 +305,14 @@ class NoteManager:
         
         try:
             response = await self.llm_service.chat(prompt)
-            match = re.search(r'\d+', response)
+            match = _FILE_INDEX_PATTERN.search(response)
             if match:
                 file_idx = int(match.group(0)) - 1
                 if 0 <= file_idx < len(self.note_files_config):
                     selected_doc = self.note_files_config[file_idx]
+                    self._file_selection_cache[cache_key] = file_idx
+                    if len(self._file_selection_cache) > _FILE_SELECTION_CACHE_SIZE:
+                        self._file_selection_cache.popitem(last=False)
                     logger.info(f"LLM选择了文件: '{selected_doc.get('name')}'")
                     return selected_doc
         except Exception as e:
@@ -182,87 +321,61 @@ class NoteManager:
         logger.warning("LLM选择文件失败，将回退到第一个文件。")
         return self.note_files_config[0]
     
+    def _route_by_keywords(self, text: str) -> Optional[int]:
+        """
+        计算内容与每个笔记文件（名称+描述）关键词集合的Jaccard相似度。
+        最高分的文件与内容至少共有 llm_routing_min_overlap 个关键词、且得分严格高于第二名并超过其
+        llm_routing_threshold 倍时返回该文件下标；否则（包括并列第一）返回 None 交由LLM决定。
+        """
+        content_keywords = _keyword_set(text)
+        if not content_keywords:
+            return None
+        scores = []
+        for idx, file_keywords in enumerate(self._note_file_keywords):
+            overlap = len(content_keywords & file_keywords)
+            union = len(content_keywords | file_keywords)
+            scores.append((overlap / union if union else 0.0, overlap, idx))
+        scores.sort(key=lambda item: item[0], reverse=True)
+        best_score, best_overlap, best_idx = scores[0]
+        runner_up_score = scores[1][0] if len(scores) > 1 else 0.0
+        if best_overlap < self.llm_routing_min_overlap or best_score <= runner_up_score:
+            return None
+        if best_score > runner_up_score * self.llm_routing_threshold:
+            return best_idx
+        return None
+
     async def _decide_insertion_location_with_llm(self, content_data: Dict[str, Any], doc_structure: Dict[str, Any]) -> InsertionDecision:
         """第二步决策：调用LLM来决定新内容在文件内的最佳插入位置。"""
+        headings = doc_structure['headings']
+        # 如果文档为空，则强制创建新的一级标题；无需构建目录树和提示词
+        if not headings:
+            return InsertionDecision(
+                thought="文档为空，必须创建一个新的一级标题来存放内容。",
+                decision="create_new_subheading", # 在_calculate_insert_location中会处理成一级标题
+                parent_heading=None,
+                new_heading_text=(content_data.get('structured_note', {}).get('title', '未命名内容'))
+            )
+
         # --- 根据配置选择分类策略 ---
         strategy_key = self.config.get('note_management', {}).get('classification_strategy', 'balanced')
-        
-        strategy_instructions = {
-            "cautious_filer": """
-# Role: 你是一位极其谨慎的档案管理员，首要任务是避免错误分类。
-
-1.  **第一优先级 (insert_into_miscellaneous)**: 这是你的默认和首选操作。除非满足下一条的**严格**条件，否则总是将内容放入最相关父标题下的"其他"分类中。
-2.  **第二优先级 (insert_under_leaf)**: 只有当新内容的主题与某个"叶子节点"的标题**完全一致或主题高度重合**时，才允许你将内容放入该叶子节点下。如果你有任何一丝犹豫，就退回使用第一优先级。
-3.  **第三优先级 (create_new_subheading)**: **（严格禁止）** 绝对不要创建新的子标题。
-""",
-            "diligent_categorizer": """
-# Role: 你是一位勤奋的图书管理员，目标是尽可能地将每一份资料都精准归档到现有的分类中。
-
-1.  **第一优先级 (insert_under_leaf)**: 请尽你最大的努力，在"叶子节点列表"中寻找一个**最相关**的现有标题，即使主题不是100%完全匹配，只要它是最合理的归宿即可。这是你的首要目标。
-2.  **第二优先级 (insert_into_miscellaneous)**: 仅当你在所有叶子节点中都**找不到任何一个**合适的归宿时，才允许将内容放入相关父标题的"其他"分类中。
-3.  **第三优先级 (create_new_subheading)**: **（几乎不用）** 只有在内容与所有现有分类都完全无关，且确实需要一个全新分类时，才考虑此选项。
-""",
-            "balanced": """
-# Role: 你是一位经验丰富的图书管理员，追求效率和结构之间的平衡。
-
-1.  **第一优先级 (insert_under_leaf)**: 检查新内容是否与"叶子节点列表"中的某个标题主题**高度匹配**。如果是，这是最优先的选择。
-2.  **第二优先级 (insert_into_miscellaneous)**: 如果找不到高度匹配的叶子，将内容放入最相关父标题的"其他"分类中，这是一个安全的选择。
-3.  **第三优先级 (create_new_subheading)**: 如果内容确实代表了一个在父标题下非常重要且**缺失**的子分类，可以创建一个新的子标题来优化结构。请不要轻易使用此选项。
-""",
-            "aggressive": """
-# Role: 你是一位富有远见的架构师，目标是主动构建和优化知识库的结构。
-
-1.  **第一优先级 (create_new_subheading)**: 新内容是否可以作为一个现有标题下的、逻辑清晰的**新子分类**？如果是，请大胆地创建新子标题，这是丰富文档结构的最佳方式。
-2.  **第二优先级 (insert_under_leaf)**: 如果无法创建有意义的新子标题，再检查内容是否与某个已有的"叶子节点"**高度匹配**。
-3.  **第三优先级 (insert_into_miscellaneous)**: 仅当内容与整个文档结构都无关时，才使用此选项。
-"""
-        }
-        
-        selected_instructions = strategy_instructions.get(strategy_key, strategy_instructions['balanced'])
+        selected_instructions = _STRATEGY_INSTRUCTIONS.get(strategy_key, _STRATEGY_INSTRUCTIONS['balanced'])
         logger.info(f"正在使用 '{strategy_key}' 分类策略。")
 
-        tree_str = self._format_headings_as_tree(doc_structure['headings'])
+        tree_str = self._format_headings_as_tree(headings)
         title = content_data.get('structured_note', {}).get('title', '')
         summary = content_data.get('structured_note', {}).get('gist', '')
 
         # 预处理，找出所有的叶子节点
-        headings = doc_structure['headings']
         leaf_nodes = self._get_leaf_nodes(headings)
         leaf_nodes_str = "\n".join([f"- {node['text']}" for node in leaf_nodes]) or "无"
 
-        prompt = f"""
-你是一位图书管理员，你的任务是根据一份现有文档的目录结构，将一份新内容精准地归类。
-你的行为模式由你的角色决定，请严格遵循。
-
-{selected_instructions}
-
-[文档现有目录结构]
-```
-{tree_str if tree_str else "此文档为空。"}
-```
-
-[可供直接归类的叶子节点列表]
-{leaf_nodes_str}
-
-[待插入的新内容]
-- 标题: {title}
-- 摘要: {summary}
-
-[注意]
-- **禁止创建新的一级标题**，除非文档完全为空。
-- 你的目标是维护一个整洁、有序的笔记结构，而不是随意扩张。
-
-请仔细思考并用中文解释你的决策过程，然后做出最终决策。
-"""
-        
-        # 如果文档为空，则强制创建新的一级标题
-        if not headings:
-            return InsertionDecision(
-                thought="文档为空，必须创建一个新的一级标题来存放内容。",
-                decision="create_new_subheading", # 在_calculate_insert_location中会处理成一级标题
-                parent_heading=None,
-                new_heading_text=(content_data.get('structured_note', {}).get('title', '未命名内容'))
-            )
+        prompt = _INSERTION_PROMPT_TEMPLATE.format(
+            instructions=selected_instructions,
+            tree=tree_str if tree_str else "此文档为空。",
+            leaves=leaf_nodes_str,
+            title=title,
+            summary=summary,
+        )
 
         return await self.llm_service.aclient.chat.completions.create(
             model=self.llm_service.model,
@@ -273,30 +386,22 @@ class NoteManager:
 
     def _get_leaf_nodes(self, headings: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """从标题列表中识别出所有的叶子节点（没有子标题的标题）。"""
-        leaf_nodes = []
-        for i, heading in enumerate(headings):
-            is_leaf = True
-            # 检查后续的标题
-            for j in range(i + 1, len(headings)):
-                next_heading = headings[j]
-                # 如果下一个标题的层级更高，说明当前标题不是叶子
-                if next_heading['level'] > heading['level']:
-                    is_leaf = False
-                    break
-                # 如果遇到同级或更低级别的标题，说明已经超出了当前子树
-                if next_heading['level'] <= heading['level']:
-                    break
-            if is_leaf:
-                leaf_nodes.append(heading)
+        # 标题按文档顺序（深度优先）排列，子标题必然紧跟在父标题之后，
+        # 所以只需把每个标题与紧随其后的标题比较：后者层级更深则当前标题不是叶子
+        leaf_nodes = [
+            heading for heading, next_heading in zip(headings, headings[1:])
+            if next_heading['level'] <= heading['level']
+        ]
+        if headings:
+            leaf_nodes.append(headings[-1])
         return leaf_nodes
 
     def _format_headings_as_tree(self, headings: List[Dict[str, Any]]) -> str:
         """将标题列表格式化为缩进的树状结构字符串。"""
-        tree_lines = []
-        for heading in headings:
-            indent = "  " * (heading['level'] - 1)
-            tree_lines.append(f"{indent}- {heading['text']} (层级 {heading['level']})")
-        return "\n".join(tree_lines)
+        return "\n".join([
+            f"{_TREE_INDENTS[heading['level'] - 1]}- {heading['text']} (层级 {heading['level']})"
+            for heading in headings
+        ])
 
     def _calculate_insert_location(self, decision: InsertionDecision, doc_structure: Dict[str, Any]) -> Dict[str, Any]:
         """根据LLM的决策计算出具体的插入位置和操作。"""
@@ -377,7 +482,7 @@ class NoteManager:
             doc_end_pos = doc_structure['end_of_document']
 
         try:
-            start_index = headings.index(target_heading)
+            start_index = self._heading_position(target_heading, doc_structure)
             # 从目标标题之后开始寻找
             for i in range(start_index + 1, len(headings)):
                 next_heading = headings[i]
@@ -390,13 +495,33 @@ class NoteManager:
         except ValueError:
             return doc_end_pos
 
+    def _heading_position(self, heading: Dict[str, Any], doc_structure: Dict[str, Any]) -> int:
+        """
+        返回标题在 doc_structure['headings'] 中的下标，找不到时抛出 ValueError（与 list.index 一致）。
+        按对象 id 建立的下标映射在首次使用时构建，之后的查找为O(1)，不必像 list.index 那样逐个比较字典。
+        传入的标题总是取自同一结构的 headings 列表。后端会缓存并复用结构对象，因此映射保存在
+        NoteManager 中（只保留最近一个 headings 列表的映射），不写入结构本身。
+        """
+        headings = doc_structure['headings']
+        cached = self._heading_positions_cache
+        # 缓存中持有 headings 列表的引用，列表不会被回收，用 is 判断即可确认是同一个列表
+        if cached is not None and cached[0] is headings:
+            positions = cached[1]
+        else:
+            positions = {id(h): i for i, h in enumerate(headings)}
+            self._heading_positions_cache = (headings, positions)
+        try:
+            return positions[id(heading)]
+        except KeyError:
+            raise ValueError("标题不在文档结构中") from None
+
     def _find_subheading(self, parent_heading: Dict[str, Any], subheading_texts: List[str], doc_structure: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """在父标题下寻找特定的子标题。"""
         headings = doc_structure['headings']
         parent_level = parent_heading['level']
         
         try:
-            parent_index = headings.index(parent_heading)
+            parent_index = self._heading_position(parent_heading, doc_structure)
             for i in range(parent_index + 1, len(headings)):
                 subsequent_heading = headings[i]
                 if subsequent_heading['level'] <= parent_level:
@@ -426,56 +551,131 @@ class NoteManager:
 
         # 2. 根据后端类型，应用不同的解析和搜索策略
         if self.note_backend_name == 'obsidian':
-            return self._search_in_obsidian_content(content, query, group_filter)
+            return self._search_in_obsidian_content(content, query, group_filter, doc_key=doc_config.get('name', ''))
         elif self.note_backend_name == 'google_docs':
-            return self._search_in_gdocs_content(content, query, group_filter)
+            return self._search_in_gdocs_content(content, query, group_filter, doc_key=doc_config.get('name', ''))
         
         return []
 
-    def _search_in_obsidian_content(self, content: str, query: str, group_filter: Optional[str]) -> List[Dict[str, Any]]:
+    def _get_obsidian_search_index(self, doc_key: str, content: str) -> Dict[str, Any]:
+        """
+        获取（或构建）Obsidian文档的条目切分缓存：各条目原文及其小写副本。
+        搜索时直接对小写副本做子串判断（在C层完成），不必每次查询都重新切分和转换大小写。
+        缓存按文档保存，只有当文档内容（长度+哈希）变化时才会重建。
+        """
+        fingerprint = (len(content), hash(content))
+        cached = self._search_index_cache.get(doc_key)
+        if cached and cached['fingerprint'] == fingerprint:
+            return cached
+
+        entries = _ENTRY_SPLIT_PATTERN.split(content)
+        index = {
+            'fingerprint': fingerprint,
+            'entries': entries,
+            'entries_lower': [entry.lower() for entry in entries],
+            # 条目编号 -> (标题, 元数据, 是否有元数据行)，在搜索命中时按需填充
+            'headers': {},
+        }
+        self._search_index_cache[doc_key] = index
+        logger.debug(f"已为文档 '{doc_key}' 切分出 {len(entries)} 个条目。")
+        return index
+
+    def _search_in_obsidian_content(self, content: str, query: str, group_filter: Optional[str], doc_key: str = '') -> List[Dict[str, Any]]:
         """在Obsidian的Markdown内容中搜索笔记条目。"""
-        # 每个条目以加粗的日期标题开始
-        entries = re.split(r'\n(?=\*\*[0-9])', content)
+        index = self._get_obsidian_search_index(doc_key, content)
+        entries = index['entries']
+        entries_lower = index['entries_lower']
         results = []
         query_lower = query.lower()
-        metadata_pattern = re.compile(r'<!-- metadata: (.*) -->')
 
-        for entry in entries:
-            if not entry.strip() or query_lower not in entry.lower():
+        for idx, entry_lower in enumerate(entries_lower):
+            if query_lower not in entry_lower:
+                continue
+            entry = entries[idx]
+            if not entry.strip():
                 continue
 
-            metadata = {}
+            title, metadata, has_metadata = self._get_entry_header(index, idx)
             passes_filter = True
-            metadata_match = metadata_pattern.search(entry)
-            if metadata_match:
-                try:
-                    metadata = json.loads(metadata_match.group(1))
-                    if group_filter and metadata.get('group_name') != group_filter:
-                        passes_filter = False
-                except json.JSONDecodeError:
-                    pass # 忽略格式错误的元数据
-            
+            if has_metadata:
+                # 元数据格式错误(None)时与以往一样不做过滤
+                if group_filter and metadata is not None and metadata.get('group_name') != group_filter:
+                    passes_filter = False
             elif group_filter: # 需要过滤但没有元数据
                 passes_filter = False
 
             if passes_filter:
-                title_match = re.search(r'\*\*(.*?)\*\*', entry)
-                title = title_match.group(1) if title_match else "无标题条目"
-                results.append({'title': title, 'text': entry.strip(), 'metadata': metadata})
+                # 返回元数据的副本，调用方（如RAG）修改结果时不会污染缓存
+                results.append({'title': title, 'text': entry.strip(), 'metadata': dict(metadata or {})})
         
         return results
 
-    def _search_in_gdocs_content(self, content: str, query: str, group_filter: Optional[str]) -> List[Dict[str, Any]]:
+    def _get_entry_header(self, index: Dict[str, Any], idx: int) -> tuple:
+        """
+        解析条目的标题和元数据，返回 (标题, 元数据字典, 是否带有元数据行)。
+        元数据行存在但JSON格式错误时，元数据为 None。
+        解析结果缓存在该文档的条目切分缓存中，随文档内容变化而失效，
+        重复的搜索不必对同一条目再次做正则匹配和JSON解析。
+        """
+        headers = index['headers']
+        header = headers.get(idx)
+        if header is not None:
+            return header
+
+        entry = index['entries'][idx]
+        head = self._entry_head(entry)
+        metadata = {}
+        metadata_match = _METADATA_PATTERN.search(head) or _METADATA_PATTERN.search(entry)
+        if metadata_match:
+            try:
+                metadata = json_utils.loads(metadata_match.group(1))
+            except json_utils.JSONDecodeError:
+                metadata = None # 忽略格式错误的元数据
+        title_match = _BOLD_TITLE_PATTERN.search(head) or _BOLD_TITLE_PATTERN.search(entry)
+        title = title_match.group(1) if title_match else "无标题条目"
+
+        header = (title, metadata, metadata_match is not None)
+        headers[idx] = header
+        return header
+
+    @staticmethod
+    def _entry_head(entry: str) -> str:
+        """
+        返回条目的头部（前三行）。
+        自动导入的条目以 "**日期 标题**" 开头，紧接着是元数据注释行，标题和元数据都在头部，
+        只在头部做正则匹配可以避免扫描很长的摘要正文；头部找不到时调用方再回退到整个条目。
+        """
+        return '\n'.join(entry.split('\n', 3)[:3])
+
+    def _search_in_gdocs_content(self, content: str, query: str, group_filter: Optional[str], doc_key: str = '') -> List[Dict[str, Any]]:
         """在Google Docs的纯文本内容中搜索段落。"""
         if group_filter:
             logger.warning("Google Docs后端的搜索当前不支持按群组过滤。")
 
         results = []
-        paragraphs = content.split('\n\n')
         query_lower = query.lower()
-        
-        for i, paragraph in enumerate(paragraphs):
-            if query_lower in paragraph.lower():
+
+        # 整篇文档的小写副本和段落切分按文档缓存，内容未变化时重复搜索无需再次转换
+        fingerprint = (len(content), hash(content))
+        cached = self._gdocs_search_cache.get(doc_key)
+        if not cached or cached['fingerprint'] != fingerprint:
+            content_lower = content.lower()
+            cached = {
+                'fingerprint': fingerprint,
+                'content_lower': content_lower,
+                'paragraphs': content.split('\n\n'),
+                # 小写转换不会引入换行符，因此按同样的分隔符切分后段落一一对应
+                'paragraphs_lower': content_lower.split('\n\n'),
+            }
+            self._gdocs_search_cache[doc_key] = cached
+
+        # 先在整篇小写文本上做一次子串查找，没有命中时无需逐段检查
+        if query_lower not in cached['content_lower']:
+            return results
+
+        paragraphs_lower = cached['paragraphs_lower']
+        for i, paragraph in enumerate(cached['paragraphs']):
+            if query_lower in paragraphs_lower[i]:
                 # 尝试从段落中提取一个标题行
                 first_line = paragraph.split('\n', 1)[0]
                 results.append({
@@ -486,12 +686,46 @@ class NoteManager:
         
         return results
 
+    async def is_url_saved(self, url: str) -> bool:
+        """
+        仅按URL快速判断链接是否已保存在任一笔记文件中。
+        在抓取网页内容、调用Agent生成笔记之前调用，已保存过的链接可以直接跳过这些昂贵步骤。
+        后端不支持按URL查询（如Google Docs）时返回False，由保存前的完整查重兜底。
+        """
+        checker = getattr(self.backend_manager, 'is_url_in_document', None)
+        if not url or checker is None:
+            return False
+        for file_config in self.note_files_config:
+            try:
+                if await checker(file_config, url):
+                    return True
+            except Exception as e:
+                logger.warning(f"按URL预查重时出错，将继续后续流程: {e}")
+                return False
+        return False
+
     async def _check_for_duplicates(self, content_data: Dict[str, Any]) -> bool:
         """遍历所有已配置的笔记文件，检查是否存在重复内容。"""
         logger.debug("开始全局查重...")
-        for file_config in self.note_files_config:
-            is_dup = await self.backend_manager.is_duplicate_in_document(file_config, content_data)
-            if is_dup:
-                return True
+        if self.note_backend_name == 'obsidian':
+            # Obsidian 的查重在线程池中读取磁盘，各文件相互独立，并发执行，
+            # 总耗时取决于最慢的一个而不是所有文件之和；任一文件命中即返回，并取消其余尚未完成的检查
+            tasks = [
+                asyncio.create_task(self.backend_manager.is_duplicate_in_document(file_config, content_data))
+                for file_config in self.note_files_config
+            ]
+            try:
+                for next_done in asyncio.as_completed(tasks):
+                    if await next_done:
+                        return True
+            finally:
+                for task in tasks:
+                    task.cancel()
+        else:
+            # Google Docs 的查重在协程内同步调用 API，并发也只会逐个执行，
+            # 因此按顺序检查，命中第一个重复后立即返回，不再请求其余文档
+            for file_config in self.note_files_config:
+                if await self.backend_manager.is_duplicate_in_document(file_config, content_data):
+                    return True
         logger.debug("全局查重完成，未发现重复内容。")
         return False 
\ No newline at end of file
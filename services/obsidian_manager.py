@@ -7,13 +7,85 @@ Obsidian 管理器
 
 import os
 import re
-import json
-import hashlib
-from datetime import datetime
+import asyncio
+import atexit
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, Any, List, Optional
+from urllib.parse import urlsplit
+from typing import Dict, Any, List, Optional, Tuple
 from loguru import logger
-import frontmatter
+
+from utils import json_utils
+
+
+# 单文件模式下笔记条目的固定格式，模块加载时构建一次，每次保存只做一次 format_map 填充
+_NOTE_ENTRY_TEMPLATE = (
+    "[自动导入]\n"
+    "**{date} {title}**\n"
+    "<!-- metadata: {metadata} -->\n"
+    "[{link_title}]({url})\n"
+    "{summary}"
+)
+
+# 查重索引用：笔记中出现的链接，以及条目标题行 "**{date} {title}**" 中的标题。
+# 链接中允许出现括号（例如维基百科的消歧义链接），匹配后再由 _trim_url 去掉末尾的标点和多余的右括号
+_URL_IN_NOTE_PATTERN = re.compile(r'https?://[^\s<>\[\]"\']+')
+# 链接末尾不属于链接本身的标点（句末标点、Markdown 链接的右括号等）
+_URL_TRAILING_PUNCTUATION = '.,;:!?)'
+_ENTRY_TITLE_PATTERN = re.compile(r'^\*\*\S+ (.+?)\*\*\s*$', re.MULTILINE)
+# Markdown 标题行。以 MULTILINE 模式直接在整篇文本上 finditer，由正则引擎定位标题行，
+# 不必在Python层逐行循环匹配；[^\S\n] 表示除换行符外的空白，保证匹配不会跨行
+_HEADING_PATTERN = re.compile(r'^(#{1,6})[^\S\n]+(.*)', re.MULTILINE)
+# 删除文件名非法字符的转换表，str.translate 在C层单趟完成，无需正则引擎
+_ILLEGAL_FILENAME_TRANS = str.maketrans('', '', '<>:"/\\|?*')
+
+# arXiv 的摘要页、PDF页以及带版本号的链接指向同一篇论文
+_ARXIV_PATH_PATTERN = re.compile(r'^/(?:abs|pdf)/(.+?)(?:v\d+)?(?:\.pdf)?$')
+
+
+@lru_cache(maxsize=8192)
+def _normalize_url(url: str) -> str:
+    """
+    将链接归一化为查重用的键，使同一内容的轻微变体被视为重复：
+    忽略 http/https 与 www. 前缀、域名大小写、路径末尾的斜杠、#片段和 utm_ 跟踪参数，
+    并把 arXiv 的 /abs/、/pdf/ 及版本号变体统一为同一篇论文。
+    其余查询参数保持原样（例如微信文章链接依靠查询参数区分不同文章）。
+    """
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    path = parts.path.rstrip('/')
+    if host == 'arxiv.org':
+        arxiv_match = _ARXIV_PATH_PATTERN.match(path)
+        if arxiv_match:
+            path = f"/abs/{arxiv_match.group(1)}"
+    query = '&'.join(p for p in parts.query.split('&') if p and not p.startswith('utm_'))
+    return f"{host}{path}?{query}" if query else f"{host}{path}"
+
+
+def _trim_url(url: str) -> str:
+    """去掉从正文中匹配到的链接末尾的标点；右括号只在多于左括号时才去掉，保留链接自身成对的括号。"""
+    while url and url[-1] in _URL_TRAILING_PUNCTUATION:
+        if url[-1] == ')' and url.count('(') >= url.count(')'):
+            break
+        url = url[:-1]
+    return url
+
+
+def _normalize_title(title: str) -> str:
+    """标题查重键：忽略大小写和多余空白。"""
+    return ' '.join(title.lower().split())
+
+
+@lru_cache(maxsize=8192)
+def _sanitize_filename(filename: str) -> str:
+    """
+    清理文件名，移除非法字符。
+    纯函数，同一标题在查重/更新流程中会被反复清理，因此用 lru_cache 缓存结果。
+    """
+    # 先截断再去除首尾空白，保证结果末尾不会残留截断产生的空格
+    return filename.translate(_ILLEGAL_FILENAME_TRANS)[:200].strip()
 
 
 class ObsidianManager:
@@ -29,6 +101,49 @@ class ObsidianManager:
         self.config = config
         self.vault_path = Path(config['vault_path'])
         self.llm_service = None
+        # 所有文件读写都通过 asyncio.to_thread 放到线程池执行，避免阻塞事件循环；
+        # 用信号量限制同时进行的磁盘操作数量，防止突发导入时挤满默认线程池
+        self._io_semaphore = asyncio.Semaphore(config.get('io_concurrency', 8))
+        # 笔记文件配置 -> 完整路径 的缓存，键为 (folder, filename)。
+        # 所有路径都在 vault_path 之下拼接得到，配置在运行期间不变，因此缓存永远有效
+        self._full_path_cache: Dict[Tuple[str, str], Path] = {}
+        # 已确认存在的笔记目录；每个目录只需 mkdir 一次，之后的调用不再产生系统调用
+        self._created_dirs: set = set()
+        # 写入由后台写入协程统一执行：execute_save 把新内容入队后等待它真正落盘，
+        # 写入协程一次取出一批请求，同一文件在一批中的多次写入合并为一次落盘（并发保存同一文件时收益明显）。
+        # _pending_writes 保存已入队但尚未落盘的最新内容，读取时优先使用它，保证能读到自己刚写的内容；
+        # _write_waiters 保存各文件等待落盘结果的 Future，写入成功或最终失败时通知对应的保存调用
+        self._pending_writes: Dict[Path, str] = {}
+        self._write_waiters: Dict[Path, List[asyncio.Future]] = {}
+        self._write_queue: asyncio.Queue = asyncio.Queue()
+        self._writer_task: Optional[asyncio.Task] = None
+        # 收到第一个写入请求后额外等待的秒数，期间到达的写入会并入同一批。
+        # 保存调用会等待落盘完成，因此默认不等待，只合并写入进行期间排队的请求
+        self._write_flush_interval = config.get('write_flush_interval', 0)
+        # 写入失败（例如文件正被其他程序占用）的文件会重新入队，等待 write_retry_delay 秒后重试，
+        # 最多重试 write_max_retries 次；_write_failures 记录各文件已连续失败的次数
+        self._write_retry_delay = config.get('write_retry_delay', 5.0)
+        self._write_max_retries = config.get('write_max_retries', 5)
+        self._write_failures: Dict[Path, int] = {}
+        # 已落盘文件的内存副本：路径 -> (文件的 st_mtime_ns, 内容)。
+        # 查重、读取结构、保存会对同一个笔记文件反复整篇读取，而文件通常有几十KB。
+        # 读取时只做一次 stat，修改时间未变就直接使用内存中的内容；
+        # 用户在Obsidian中手动编辑过文件时修改时间会变化，此时重新从磁盘读取
+        self._content_cache: Dict[Path, Tuple[int, str]] = {}
+        # 查重索引：路径 -> (建立索引时的文件内容, 链接集合, 条目标题集合)。
+        # 每个内容版本只用正则扫描一次建立集合，之后每次查重都是O(1)的集合查找；
+        # 保存新条目时直接把新链接和标题加入集合，不必重新扫描整篇笔记。
+        # 笔记文件本身就是权威数据源，索引只保存在内存中，进程启动后首次查重时重建
+        self._dup_index: Dict[Path, Tuple[str, set, set]] = {}
+        # 标题结构缓存：路径 -> (解析时的文件内容, 结构字典)。每次保存前都要获取一次标题层级，
+        # 文件内容未变化（同一个字符串对象）时直接复用上次的解析结果。
+        # 假设：调用方只读取返回的结构、不会就地修改它（NoteManager 和 execute_save 均如此）
+        self._structure_cache: Dict[Path, Tuple[str, Dict[str, Any]]] = {}
+        # 每个笔记文件一把锁：保存时"读取最新内容 -> 拼接新条目 -> 提交写入"必须串行，
+        # 否则并发的两次保存（例如历史导入与实时消息）会基于同一份旧内容拼接，后写入的覆盖先写入的
+        self._save_locks: Dict[Path, asyncio.Lock] = {}
+        # 正常关闭时由 flush() 等待写入完成；这里再兜底：进程退出时同步写出仍未落盘的内容，避免丢失
+        atexit.register(self._flush_pending_writes_sync)
         
         logger.info("Obsidian管理器初始化成功。")
 
@@ -36,12 +151,139 @@ class ObsidianManager:
         """注入LLM服务实例 (当前未使用，为未来功能保留)"""
         self.llm_service = llm_service
 
+    async def _run_io(self, func, *args):
+        """在线程池中执行一个同步的文件I/O函数，并受并发信号量约束。"""
+        async with self._io_semaphore:
+            return await asyncio.to_thread(func, *args)
+
+    def _read_document_sync(self, file_path: Path) -> str:
+        """
+        读取笔记文件内容，优先返回尚未落盘的待写入内容。
+        文件不存在时抛出 FileNotFoundError，由调用方处理。
+        """
+        pending = self._pending_writes.get(file_path)
+        if pending is not None:
+            return pending
+        mtime_ns = file_path.stat().st_mtime_ns
+        cached = self._content_cache.get(file_path)
+        if cached is not None and cached[0] == mtime_ns:
+            return cached[1]
+        content = file_path.read_text(encoding='utf-8')
+        self._content_cache[file_path] = (mtime_ns, content)
+        return content
+
+    def _ensure_writer(self):
+        """
+        惰性启动后台写入协程（构造函数中可能还没有运行中的事件循环）。
+        协程意外退出时只重新启动协程，继续使用原来的队列，已入队的请求不会丢失。
+        """
+        if self._writer_task is None or self._writer_task.done():
+            self._writer_task = asyncio.create_task(self._writer_loop())
+
+    def _enqueue_write(self, file_path: Path, content: str) -> asyncio.Future:
+        """
+        将文件的最新完整内容交给后台写入协程。
+
+        Returns:
+            该内容落盘后完成的 Future；重试次数用尽仍写入失败时，Future 以写入异常结束。
+        """
+        self._pending_writes[file_path] = content
+        waiter = asyncio.get_running_loop().create_future()
+        self._write_waiters.setdefault(file_path, []).append(waiter)
+        self._ensure_writer()
+        self._write_queue.put_nowait(file_path)
+        return waiter
+
+    async def _writer_loop(self):
+        """后台写入协程：批量取出写入请求，按文件合并后落盘。"""
+        while True:
+            batch = [await self._write_queue.get()]
+            # 上一批有写入失败时，至少等待 write_retry_delay 秒再重试
+            delay = self._write_flush_interval
+            if self._write_failures:
+                delay = max(delay, self._write_retry_delay)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            # 把队列中已经积压的请求一并取出（最多50个），合并为一批
+            while len(batch) < 50 and not self._write_queue.empty():
+                batch.append(self._write_queue.get_nowait())
+
+            # 同一文件在本批中出现多次时只写一次最新内容
+            failed = []
+            for file_path in dict.fromkeys(batch):
+                content = self._pending_writes.get(file_path)
+                if content is None:
+                    continue
+                # 取出此刻登记的等待者：它们的内容都已包含在本次写入的最新内容中；
+                # 写盘期间新登记的等待者对应更新的内容，留给下一批
+                waiters = self._write_waiters.pop(file_path, [])
+                try:
+                    await self._run_io(self._write_document_sync, file_path, content)
+                    logger.debug(f"已将 {file_path.name} 写入磁盘（本批 {len(batch)} 个写入请求）。")
+                except Exception as e:
+                    attempts = self._write_failures.get(file_path, 0) + 1
+                    if attempts <= self._write_max_retries:
+                        self._write_failures[file_path] = attempts
+                        failed.append(file_path)
+                        self._write_waiters.setdefault(file_path, [])[:0] = waiters
+                        logger.warning(f"写入文件 {file_path} 时失败（第 {attempts} 次），稍后重试: {e}")
+                    else:
+                        # 重试次数用尽：通知等待中的保存调用失败；内容仍保留在内存中，
+                        # 下次保存该文件或进程退出时会再次尝试写入
+                        self._write_failures.pop(file_path, None)
+                        self._resolve_waiters(waiters, e)
+                        logger.error(f"写入文件 {file_path} 连续失败，暂停重试，内容尚未保存到磁盘: {e}", exc_info=True)
+                    continue
+                self._write_failures.pop(file_path, None)
+                self._resolve_waiters(waiters)
+                # 写盘期间如果又有更新的内容入队，则保留它，由下一批写入
+                if self._pending_writes.get(file_path) is content:
+                    del self._pending_writes[file_path]
+
+            # 先把需要重试的文件重新入队，再标记本批完成，保证 flush() 会等待重试结束
+            for file_path in failed:
+                self._write_queue.put_nowait(file_path)
+            for _ in batch:
+                self._write_queue.task_done()
+
+    @staticmethod
+    def _resolve_waiters(waiters: List[asyncio.Future], error: Optional[BaseException] = None):
+        """通知等待落盘的保存调用写入成功，或以 error 失败。"""
+        for waiter in waiters:
+            if waiter.done():
+                continue
+            if error is None:
+                waiter.set_result(None)
+            else:
+                waiter.set_exception(error)
+
+    async def flush(self) -> bool:
+        """
+        等待所有已入队的写入（包括失败后的重试）完成落盘。
+
+        Returns:
+            所有内容是否都已写入磁盘；为 False 时仍有内容只保存在内存中。
+        """
+        if self._writer_task is not None and not self._writer_task.done():
+            await self._write_queue.join()
+        if self._pending_writes:
+            logger.error(f"仍有 {len(self._pending_writes)} 个笔记文件的内容未能写入磁盘: "
+                         f"{', '.join(p.name for p in self._pending_writes)}")
+            return False
+        return True
+
+    def _flush_pending_writes_sync(self):
+        """同步写出所有未落盘的内容，用于进程退出时兜底。"""
+        for file_path, content in list(self._pending_writes.items()):
+            try:
+                self._write_document_sync(file_path, content)
+            except Exception as e:
+                logger.error(f"退出前写入文件 {file_path} 时失败: {e}")
+        self._pending_writes.clear()
+
     def _sanitize_filename(self, filename: str) -> str:
         """清理文件名，移除非法字符"""
-        filename = re.sub(r'[<>:"/\\|?*]', '', filename)
-        if len(filename) > 200:
-            filename = filename[:200]
-        return filename.strip()
+        return _sanitize_filename(filename)
 
     def get_full_path(self, note_file_config: Dict[str, Any]) -> Path:
         """
@@ -54,11 +296,19 @@ class ObsidianManager:
         
         sub_folder_name = note_file_config.get('folder', '')
         
-        target_folder = self.vault_path / sub_folder_name
+        # 查重、读取、保存会对同一个文件反复调用本方法，缓存拼接结果避免重复构造Path
+        cache_key = (sub_folder_name, filename)
+        full_path = self._full_path_cache.get(cache_key)
+        if full_path is None:
+            full_path = self.vault_path / sub_folder_name / filename
+            self._full_path_cache[cache_key] = full_path
         
-        target_folder.mkdir(parents=True, exist_ok=True)
+        parent_dir = full_path.parent
+        if parent_dir not in self._created_dirs:
+            parent_dir.mkdir(parents=True, exist_ok=True)
+            self._created_dirs.add(parent_dir)
         
-        return target_folder / filename
+        return full_path
 
     async def get_document_structure(self, file_path: Path) -> Optional[Dict[str, Any]]:
         """
@@ -68,46 +318,64 @@ class ObsidianManager:
             一个字典，包含:
             - 'headings': 标题列表 [{'text', 'level', 'startIndex', 'endIndex' (行号)}]
             - 'end_of_document': 文档末尾的行号。
-            - 'raw_content': 文件的原始文本内容。
+            - 'raw_document': 文件的原始文本内容。
+            - 'line_offsets': 标题所在行号 -> 该行在 raw_document 中的字符偏移。
         """
-        if not file_path.exists():
-            return {
-                'headings': [],
-                'end_of_document': 1,
-                'raw_content': f"# {file_path.stem}\n\n"
-            }
-        
+        return await self._run_io(self._get_document_structure_sync, file_path)
+
+    def _get_document_structure_sync(self, file_path: Path) -> Optional[Dict[str, Any]]:
+        """get_document_structure 的同步实现，在工作线程中运行。"""
         try:
-            content = file_path.read_text(encoding='utf-8')
-            lines = content.split('\n')
+            # 直接尝试打开文件，而不是先 exists() 再读取，省去一次多余的 stat 调用
+            try:
+                content = self._read_document_sync(file_path)
+            except FileNotFoundError:
+                # 文件尚不存在：返回一个空结构，execute_save 会以此为基础创建文件
+                raw_document = f"# {file_path.stem}\n\n"
+                return {
+                    'headings': [],
+                    'end_of_document': 1,
+                    'raw_document': raw_document,
+                    'line_offsets': {}
+                }
+            cached = self._structure_cache.get(file_path)
+            if cached is not None and cached[0] is content:
+                return cached[1]
+
             headings = []
-            
-            heading_pattern = re.compile(r'^(#{1,6})\s+(.*)')
-            
-            for i, line in enumerate(lines):
-                match = heading_pattern.match(line)
-                if match:
-                    level = len(match.group(1))
-                    text = match.group(2).strip()
-                    headings.append({
-                        'text': text,
-                        'level': level,
-                        'startIndex': i + 1,
-                        'endIndex': i + 1
-                    })
+            line_offsets = {}
+
+            # 行号由上一个标题之后的换行符数量累加得到（1-based）
+            line_no = 1
+            last_pos = 0
+            for match in _HEADING_PATTERN.finditer(content):
+                line_no += content.count('\n', last_pos, match.start())
+                last_pos = match.start()
+                headings.append({
+                    'text': match.group(2).strip(),
+                    'level': len(match.group(1)),
+                    'startIndex': line_no,
+                    'endIndex': line_no
+                })
+                line_offsets[line_no] = match.start()
             
             structure = {
                 'headings': headings,
-                'end_of_document': len(lines) + 1,
-                'raw_document': content
+                # 行数 = 换行符数 + 1；不再为此把整篇文档切分成行列表
+                'end_of_document': content.count('\n') + 2,
+                'raw_document': content,
+                # 插入位置总是某个标题的起始行或文档末尾，保存时据此直接定位字符偏移
+                'line_offsets': line_offsets
             }
+            self._structure_cache[file_path] = (content, structure)
             logger.debug(f"从文件 {file_path.name} 提取到 {len(headings)} 个标题。")
             return structure
         except Exception as e:
             logger.error(f"读取或解析Obsidian笔记 {file_path} 失败: {e}")
             return None
 
-    async def execute_save(self, file_path: Path, content_data: Dict[str, Any], insert_location: Dict[str, Any]):
+    async def execute_save(self, file_path: Path, content_data: Dict[str, Any], insert_location: Dict[str, Any],
+                           doc_structure: Optional[Dict[str, Any]] = None):
         """
         根据精确指令，将内容保存到指定的Obsidian文件中。
 
@@ -115,21 +383,43 @@ class ObsidianManager:
             file_path: 目标文件路径。
             content_data: 包含结构化笔记和元数据的内容。
             insert_location: 包含插入位置和操作的指令字典。
+            doc_structure: (可选) 调用方计算插入位置时使用的文档结构。
         """
         logger.info(f"开始执行Obsidian保存任务, 目标文件: {file_path}")
-        
-        doc_structure = await self.get_document_structure(file_path)
-        if not doc_structure:
-            logger.error(f"无法获取 {file_path} 的结构，取消保存。")
+
+        lock = self._save_locks.get(file_path)
+        if lock is None:
+            lock = self._save_locks[file_path] = asyncio.Lock()
+        async with lock:
+            written = await self._execute_save_locked(file_path, content_data, insert_location, doc_structure)
+        if written is None:
             return
+        # 在锁外等待落盘，写入期间对同一文件的其他保存可以继续排队，由写入协程合并为一次写入。
+        # 重试次数用尽仍写入失败时抛出异常，调用方不会把未落盘的内容当作保存成功
+        await written
+        title = content_data.get('structured_note', {}).get('title', '')
+        logger.info(f"内容 '{title}' 已保存到 {file_path.name}")
 
-        lines = doc_structure['raw_document'].split('\n')
-        
+    async def _execute_save_locked(self, file_path: Path, content_data: Dict[str, Any],
+                                   insert_location: Dict[str, Any],
+                                   doc_structure: Optional[Dict[str, Any]]) -> Optional[asyncio.Future]:
+        """
+        execute_save 的主体，调用方已持有该文件的保存锁。
+        返回新内容落盘后完成的 Future；无法获取文件结构、取消保存时返回 None。
+        """
+        # 从LLM决策到真正写入之间可能隔了数秒，文件可能已被用户或并发的保存修改，
+        # 因此仍以最新内容为准。文档未变化时结构缓存直接返回同一个对象，只多一次 stat，不会重新解析
+        current_structure = await self.get_document_structure(file_path)
+        if not current_structure:
+            logger.error(f"无法获取 {file_path} 的结构，取消保存。")
+            return None
+        if doc_structure is not None and doc_structure['raw_document'] != current_structure['raw_document']:
+            logger.warning(f"文件 {file_path.name} 在决定插入位置后发生了变化，将按原位置插入到最新内容中。")
+        doc_structure = current_structure
+
+        # 查重已由调用方（NoteManager.save_content 的全局查重）在保存前完成，这里不再重复检查
         url = content_data.get('url', '')
         title = content_data.get('structured_note', {}).get('title', '')
-        if await self.is_duplicate_in_document(file_path, content_data):
-             logger.info(f"内容在Obsidian文件 {file_path.name} 中已存在，跳过保存。")
-             return
 
         insert_pos = insert_location['position']
         action = insert_location['action']
@@ -144,69 +434,169 @@ class ObsidianManager:
         note_entry = self._build_note_entry(content_data['structured_note'], url, content_data)
         new_content_parts.append(note_entry + "\n")
 
-        insert_index = max(0, insert_pos - 1)
-        lines.insert(insert_index, "\n".join(new_content_parts))
-        
-        updated_content = "\n".join(lines)
+        # 在原文的字符偏移处直接拼接新内容，不再把整篇文档切分成行列表再重新 join。
+        # 结果与在行列表的第 insert_pos-1 项之前插入新块后再用换行连接完全一致
+        raw_document = doc_structure['raw_document']
+        new_block = "\n".join(new_content_parts)
+        offset = self._line_start_offset(doc_structure, insert_pos)
+        if offset is None:
+            updated_content = f"{raw_document}\n{new_block}"
+        else:
+            updated_content = f"{raw_document[:offset]}{new_block}\n{raw_document[offset:]}"
+        self._update_dup_index(file_path, raw_document, updated_content, note_entry, title)
+
+        # 交给后台写入协程落盘，由 execute_save 在释放锁后等待写入结果
+        return self._enqueue_write(file_path, updated_content)
+
+    @staticmethod
+    def _line_start_offset(doc_structure: Dict[str, Any], line_no: int) -> Optional[int]:
+        """
+        返回第 line_no 行（1-based）行首在原文中的字符偏移；该行超出文档末尾时返回 None。
+        标题行的偏移在解析结构时已记录；其余行号（极少出现）才逐个查找换行符。
+        """
+        if line_no <= 1:
+            return 0
+        offset = doc_structure['line_offsets'].get(line_no)
+        if offset is not None:
+            return offset
+        content = doc_structure['raw_document']
+        pos = -1
+        for _ in range(line_no - 1):
+            pos = content.find('\n', pos + 1)
+            if pos == -1:
+                return None
+        return pos + 1
 
+    def _write_document_sync(self, file_path: Path, content: str):
+        """将完整内容写回文件，在工作线程中运行。"""
+        # 新条目插入在文档末尾时，新内容只是在磁盘上现有内容后面追加了一段：
+        # 此时以追加模式只写入新增部分，避免整篇重写越来越大的笔记文件。
+        # 仅当磁盘文件自上次读写后未被修改（修改时间一致）时才能确定现有内容，否则整篇重写
+        cached = self._content_cache.get(file_path)
+        if cached is not None and len(content) > len(cached[1]) and content.startswith(cached[1]):
+            try:
+                unchanged_on_disk = file_path.stat().st_mtime_ns == cached[0]
+            except FileNotFoundError:
+                unchanged_on_disk = False
+            if unchanged_on_disk:
+                with open(file_path, 'ab') as f:
+                    f.write(content[len(cached[1]):].encode('utf-8'))
+                self._content_cache[file_path] = (file_path.stat().st_mtime_ns, content)
+                return
+
+        # 一次性编码后以二进制写入，跳过文本IO层的增量编码器和缓冲；
+        # 内容中的换行统一为 \n，不再随平台转换为 \r\n
+        data = content.encode('utf-8')
+        # 整篇重写时先写入同目录下的临时文件再原子替换，写到一半时进程退出也不会留下被截断的笔记。
+        # 替换失败（例如Windows上文件正被其他程序占用）时退回直接覆盖写入
+        tmp_path = file_path.with_name(file_path.name + '.tmp')
         try:
-            with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(updated_content)
-            logger.info(f"内容 '{title}' 已成功保存到 {file_path.name}")
-        except Exception as e:
-            logger.error(f"写入文件 {file_path} 时失败: {e}", exc_info=True)
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, file_path)
+        except OSError as e:
+            logger.warning(f"原子替换 {file_path.name} 失败，改为直接写入: {e}")
+            tmp_path.unlink(missing_ok=True)
+            file_path.write_bytes(data)
+        # 刚写入的内容就是文件的最新内容，记录下来，下次读取时无需再从磁盘读回
+        self._content_cache[file_path] = (file_path.stat().st_mtime_ns, content)
 
     def _build_note_entry(self, structured_note: Dict[str, str], url: str, content_data: Dict[str, Any]) -> str:
         """
         为单文件模式构建紧凑的笔记条目，并嵌入元数据。
         """
-        date = structured_note['date']
-        title = structured_note['title']
-        link_title = structured_note['link_title']
-        summary = structured_note['gist']
-        
         metadata_to_embed = {
             "url": url,
             "source_user": content_data.get('source_user', ''),
             "group_name": content_data.get('group_name', ''),
             "is_history": content_data.get('is_history', False)
         }
-        metadata_comment = f"<!-- metadata: {json.dumps(metadata_to_embed, ensure_ascii=False)} -->"
         
-        return f"""
-[自动导入]
-**{date} {title}**
-{metadata_comment}
-[{link_title}]({url})
-{summary}
-""".strip()
+        # 条目开头固定为"[自动导入]"，所以只需去掉末尾空白，与原先的 .strip() 等价
+        return _NOTE_ENTRY_TEMPLATE.format_map({
+            'date': structured_note['date'],
+            'title': structured_note['title'],
+            'metadata': json_utils.dumps(metadata_to_embed),
+            'link_title': structured_note['link_title'],
+            'url': url,
+            'summary': structured_note['gist'],
+        }).rstrip()
 
     async def is_duplicate_in_document(self, doc_config: Dict[str, Any], content_data: Dict[str, Any]) -> bool:
         """
         在单个Obsidian笔记文件中检查是否有重复内容。
         """
         file_path = self.get_full_path(doc_config)
-        if not file_path.exists():
-            return False
 
         url = content_data.get('url', '')
         title = content_data.get('structured_note', {}).get('title', '')
         if not url and not title:
             return False
 
+        return await self._run_io(self._is_duplicate_in_document_sync, file_path, url, title, doc_config.get('name'))
+
+    def _get_dup_index(self, file_path: Path, content: str) -> Tuple[set, set]:
+        """获取文件当前内容对应的 (链接集合, 标题集合)，内容变化时重建。"""
+        entry = self._dup_index.get(file_path)
+        # 读取接口对同一内容版本总是返回同一个字符串对象，用 is 比较即可判断索引是否过期
+        if entry is not None and entry[0] is content:
+            return entry[1], entry[2]
+        urls = {_normalize_url(_trim_url(u)) for u in _URL_IN_NOTE_PATTERN.findall(content)}
+        titles = {_normalize_title(t) for t in _ENTRY_TITLE_PATTERN.findall(content)}
+        self._dup_index[file_path] = (content, urls, titles)
+        return urls, titles
+
+    def _update_dup_index(self, file_path: Path, old_content: str, new_content: str, note_entry: str, title: str):
+        """保存新条目后增量更新查重索引；索引已过期时丢弃，下次查重时重建。"""
+        entry = self._dup_index.get(file_path)
+        if entry is None or entry[0] is not old_content:
+            self._dup_index.pop(file_path, None)
+            return
+        urls, titles = entry[1], entry[2]
+        urls.update(_normalize_url(_trim_url(u)) for u in _URL_IN_NOTE_PATTERN.findall(note_entry))
+        if title:
+            titles.add(_normalize_title(title))
+        self._dup_index[file_path] = (new_content, urls, titles)
+
+    def _is_duplicate_in_document_sync(self, file_path: Path, url: str, title: str, doc_name: Optional[str]) -> bool:
+        """is_duplicate_in_document 的同步实现，在工作线程中运行。"""
         try:
-            content = file_path.read_text(encoding='utf-8')
-            if url and url in content:
-                logger.debug(f"在文件 '{doc_config.get('name')}' 中发现重复内容（URL匹配）: '{url}'")
+            try:
+                content = self._read_document_sync(file_path)
+            except FileNotFoundError:
+                return False
+            urls, titles = self._get_dup_index(file_path, content)
+            if url and _normalize_url(url) in urls:
+                logger.debug(f"在文件 '{doc_name}' 中发现重复内容（URL匹配）: '{url}'")
                 return True
-            if title and title in content:
-                logger.debug(f"在文件 '{doc_config.get('name')}' 中发现疑似重复内容（标题匹配）: '{title}'")
+            # 标题索引只覆盖自动导入条目的标题行；旧笔记或手动编辑过的笔记中标题可能出现在任意位置，
+            # 因此索引未命中时再对全文做一次子串查找
+            if title and (_normalize_title(title) in titles or title in content):
+                logger.debug(f"在文件 '{doc_name}' 中发现疑似重复内容（标题匹配）: '{title}'")
                 return True
         except Exception as e:
             logger.error(f"检查Obsidian重复内容时出错: {e}")
         
         return False
 
+    async def is_url_in_document(self, doc_config: Dict[str, Any], url: str) -> bool:
+        """
+        仅按URL检查链接是否已保存在该笔记文件中（查重索引中的O(1)集合查找）。
+        用于在抓取网页和调用LLM之前提前跳过已保存过的链接。
+        """
+        if not url:
+            return False
+        file_path = self.get_full_path(doc_config)
+        return await self._run_io(self._is_url_in_document_sync, file_path, url)
+
+    def _is_url_in_document_sync(self, file_path: Path, url: str) -> bool:
+        """is_url_in_document 的同步实现，在工作线程中运行。"""
+        try:
+            content = self._read_document_sync(file_path)
+        except FileNotFoundError:
+            return False
+        urls, _ = self._get_dup_index(file_path, content)
+        return _normalize_url(url) in urls
+
     async def get_document_text(self, doc_config: Dict[str, Any]) -> Optional[str]:
         """
         获取单个Obsidian笔记文件的纯文本内容。
@@ -219,11 +609,15 @@ class ObsidianManager:
         """
         try:
             file_path = self.get_full_path(doc_config)
-            if file_path.exists():
-                return file_path.read_text(encoding='utf-8')
-            else:
-                logger.warning(f"请求的Obsidian笔记文件不存在: {file_path}")
-                return None
+            return await self._run_io(self._get_document_text_sync, file_path)
         except Exception as e:
             logger.error(f"读取Obsidian笔记文件 {doc_config.get('filename')} 时失败: {e}", exc_info=True)
-            return None 
\ No newline at end of file
+            return None 
+
+    def _get_document_text_sync(self, file_path: Path) -> Optional[str]:
+        """get_document_text 的同步实现，在工作线程中运行。"""
+        try:
+            return self._read_document_sync(file_path)
+        except FileNotFoundError:
+            logger.warning(f"请求的Obsidian笔记文件不存在: {file_path}")
+            return None
\ No newline at end of file
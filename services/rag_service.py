@@ -5,8 +5,61 @@ RAG (Retrieval-Augmented Generation) 服务
 负责根据用户问题，从笔记库中实时检索相关内容，并结合LLM生成回答。
 """
 import re
-from typing import Dict, Any, List, Optional
+import time
+import heapq
+import asyncio
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
 from loguru import logger
+from pydantic import BaseModel, Field
+
+# 第一层文件选择结果缓存的最大条目数与有效期（秒）
+_FILE_SELECTION_CACHE_SIZE = 256
+_FILE_SELECTION_CACHE_TTL = 600
+
+# 第一层文件选择的提示词模板，文件列表按编号给出，要求返回编号，避免LLM复述或编造文件名
+_RELEVANT_FILES_PROMPT_TEMPLATE = """
+你是一个信息检索专家。你的任务是根据一个用户问题，从下面的文件列表中，选出所有可能包含相关信息的文件。
+
+[用户问题]
+"{query}"
+
+[文件列表]
+{options}
+
+[你的任务]
+请分析问题和文件描述，选出所有相关文件的编号。如果多个文件都可能相关，请全部列出。
+
+[输出格式]
+在 selected 中返回所有相关文件的编号。
+"""
+
+# 第二层检索后生成回答的提示词模板
+_ANSWER_PROMPT_TEMPLATE = """
+你是一个智能助理。请根据以下从多个笔记文件中检索到的、最相关的上下文信息，来回答用户的问题。
+
+[上下文信息]
+{context}
+
+[用户问题]
+{query}
+
+请注意：
+- 请只根据提供的上下文信息进行回答，不要编造信息。
+- 如果上下文信息不足以回答问题，请明确告知用户"根据现有笔记，我无法回答这个问题"。
+- 你的回答应该简洁、清晰、并直接针对用户的问题。
+"""
+
+# 跨文件 Reciprocal Rank Fusion 的平滑常数（常用取值60）
+_RRF_K = 60
+
+
+class RelevantFileSelection(BaseModel):
+    """
+    一个Pydantic模型，用于规范LLM在RAG第一层选择的相关文件。
+    """
+    selected: List[int] = Field(..., description="所有可能包含相关信息的文件编号（从1开始）。")
+
 
 class RAGService:
     """
@@ -23,7 +76,8 @@ class RAGService:
             llm_service: LLM服务实例
             note_manager: 笔记管理器实例
         """
-        self.config = config.get('rag', {})
+        # 调用方（app.py）传入的已经是 'rag' 配置段本身
+        self.config = config
         self.enabled = self.config.get('enabled', False)
         if not self.enabled:
             logger.info("RAG服务未启用。")
@@ -32,6 +86,10 @@ class RAGService:
         self.llm_service = llm_service
         self.note_manager = note_manager
         self.top_k = self.config.get('top_k', 5)
+        # 第一层LLM文件选择的结果缓存: {(归一化问题, 文件名元组): (写入时间, 选中的文件名列表)}，按LRU淘汰
+        self._file_selection_cache: "OrderedDict[Tuple[str, tuple], Tuple[float, List[str]]]" = OrderedDict()
+        # 文件列表提示词片段的快照: (文件名与描述的签名, 编号列表文本)，笔记文件配置变化时重建
+        self._options_snapshot: Optional[Tuple[tuple, str]] = None
         
         logger.info(f"RAG服务初始化成功 (双层实时检索模式)，将检索 Top {self.top_k} 个结果。")
 
@@ -43,45 +101,81 @@ class RAGService:
         if not all_files or len(all_files) <= 1:
             return all_files
 
-        options_str = "\n".join([
-            f"- 文件名: {f.get('name', '未命名')}\n  描述: {f.get('description', '无描述')}"
-            for f in all_files
-        ])
-
-        prompt = f"""
-你是一个信息检索专家。你的任务是根据一个用户问题，从下面的文件列表中，选出所有可能包含相关信息的文件。
-
-[用户问题]
-"{query}"
-
-[文件列表]
-{options_str}
-
-[你的任务]
-请分析问题和文件描述，列出所有相关的文件名。如果多个文件都可能相关，请全部列出。
-
-[输出格式]
-请严格按照以下格式回答，每行一个文件名，不要添加任何其他内容：
-文件名1
-文件名2
-...
-"""
+        # 相同（忽略大小写和多余空白）的问题在有效期内直接复用上次选中的文件，省去一次LLM调用。
+        # 键中包含当前全部文件名，笔记文件配置变化后旧的结果自然不再命中
+        cache_key = (' '.join(query.lower().split()), tuple(sorted(f.get('name', '') for f in all_files)))
+        cached = self._file_selection_cache.get(cache_key)
+        if cached is not None:
+            if time.monotonic() - cached[0] < _FILE_SELECTION_CACHE_TTL:
+                self._file_selection_cache.move_to_end(cache_key)
+                selected_configs = [f_config for f_config in all_files if f_config.get('name') in cached[1]]
+                logger.info(f"RAG第一层：命中文件选择缓存，搜索 {len(selected_configs)} 个文件: {[f.get('name') for f in selected_configs]}")
+                return selected_configs
+            del self._file_selection_cache[cache_key]
+
+        prompt = _RELEVANT_FILES_PROMPT_TEMPLATE.format(query=query, options=self._get_options_str(all_files))
         
         try:
-            response = await self.llm_service.chat(prompt)
-            relevant_file_names = [name.strip() for name in response.split('\n') if name.strip()]
+            # 与 NoteManager 的插入位置决策一样，通过 instructor 的 response_model 约束输出结构，
+            # 得到的一定是编号列表，不再需要从自由文本中解析
+            selection = await self.llm_service.aclient.chat.completions.create(
+                model=self.llm_service.model,
+                response_model=RelevantFileSelection,
+                messages=[{"role": "user", "content": prompt}],
+                max_retries=2,
+            )
+            selected_indices = self._valid_indices(selection.selected, len(all_files))
             
-            if not relevant_file_names:
+            if not selected_indices:
                 logger.warning("LLM未能确定任何相关文件，将搜索所有文件作为后备。")
                 return all_files
 
-            selected_configs = [f_config for f_config in all_files if f_config.get('name') in relevant_file_names]
+            relevant_file_names = [all_files[idx].get('name') for idx in selected_indices]
+            selected_configs = [all_files[idx] for idx in selected_indices]
+            self._file_selection_cache[cache_key] = (time.monotonic(), relevant_file_names)
+            if len(self._file_selection_cache) > _FILE_SELECTION_CACHE_SIZE:
+                self._file_selection_cache.popitem(last=False)
             logger.info(f"RAG第一层：LLM选择了 {len(selected_configs)} 个相关文件进行搜索: {[f.get('name') for f in selected_configs]}")
             return selected_configs
         except Exception as e:
             logger.error(f"LLM选择相关文件失败: {e}，将搜索所有文件作为后备。")
             return all_files
 
+    def _get_options_str(self, all_files: List[Dict[str, Any]]) -> str:
+        """返回带编号的文件列表文本；文件名和描述不变时复用上次构建的结果。"""
+        signature = tuple((f.get('name'), f.get('description')) for f in all_files)
+        if self._options_snapshot is None or self._options_snapshot[0] != signature:
+            options_str = "\n".join([
+                f"{i + 1}. {f.get('name', '未命名')} — {f.get('description', '无描述')}"
+                for i, f in enumerate(all_files)
+            ])
+            self._options_snapshot = (signature, options_str)
+        return self._options_snapshot[1]
+
+    @staticmethod
+    def _valid_indices(selected: List[int], file_count: int) -> List[int]:
+        """把LLM给出的1-based文件编号转换为去重并排序后的0-based下标，忽略越界的编号。"""
+        # 按文件配置顺序返回，与以往按文件名筛选时的顺序一致
+        return sorted({number - 1 for number in selected if 1 <= number <= file_count})
+
+    @staticmethod
+    def _rank_by_relevance(snippets: List[Dict[str, Any]], query_lower: str) -> List[Tuple[int, Dict[str, Any]]]:
+        """
+        按相关度（问题在片段文本中出现的次数）降序排列单个文件的搜索结果，返回 (名次, 片段) 列表。
+        名次从0开始，相关度相同的片段名次相同（并列时保持文件内顺序）。
+        """
+        scored = sorted(
+            ((s.get('text', '').lower().count(query_lower), s) for s in snippets),
+            key=lambda item: item[0], reverse=True
+        )
+        ranked = []
+        rank = 0
+        for position, (score, s) in enumerate(scored):
+            if position and score < scored[position - 1][0]:
+                rank = position
+            ranked.append((rank, s))
+        return ranked
+
     async def answer_question(self, query: str, group_filter: Optional[str] = None) -> str:
         """
         使用双层RAG流程回答问题：先选文件，再在文件内搜索。
@@ -95,20 +189,40 @@ class RAGService:
             relevant_files = await self._select_relevant_files_with_llm(query)
 
             # 2. RAG第二层：在选定的每个文件内进行搜索
-            all_snippets = []
-            for file_config in relevant_files:
-                snippets = await self.note_manager.search_in_document(file_config, query, group_filter)
-                for s in snippets:
+            # 各文件的搜索相互独立，一起提交；Obsidian 的文件读取在线程池中并发进行，总耗时取决于最慢的一个。
+            # 单个文件搜索失败时跳过该文件
+            search_results = await asyncio.gather(
+                *[self.note_manager.search_in_document(file_config, query, group_filter) for file_config in relevant_files],
+                return_exceptions=True
+            )
+            # 跨文件融合排序（Reciprocal Rank Fusion）：先在每个文件内按相关度（问题在片段中出现的次数）排名，
+            # 片段的名次 rank 贡献 1/(K+rank) 分，相关度相同的片段名次相同，不按其在文档中的先后区分。
+            # 这样各文件最相关的片段会优先进入 top_k，而不是让排在前面的文件占满名额；
+            # 同一条笔记可能被多个文件收录，按文本（忽略大小写和空白差异）合并，分数累加
+            query_lower = query.lower()
+            fused_snippets = {}  # 文本键 -> [融合分数, 片段]
+            for file_config, snippets in zip(relevant_files, search_results):
+                if isinstance(snippets, Exception):
+                    logger.error(f"RAG: 在文件 '{file_config.get('name')}' 中搜索失败: {snippets}")
+                    continue
+                for rank, s in self._rank_by_relevance(snippets, query_lower):
                     s['document_name'] = file_config.get('name') # 确保来源信息
-                all_snippets.extend(snippets)
+                    text_key = ' '.join(s.get('text', '').lower().split())
+                    fused = fused_snippets.get(text_key)
+                    if fused is None:
+                        fused_snippets[text_key] = [1.0 / (_RRF_K + rank), s]
+                    else:
+                        fused[0] += 1.0 / (_RRF_K + rank)
             
-            if not all_snippets:
+            if not fused_snippets:
                 logger.warning("RAG: 未在任何相关文件中找到匹配片段，将直接由LLM回答。")
                 return await self.llm_service.chat(f"请直接回答这个问题: {query}")
 
             # 3. 构建上下文
-            # TODO: 在此可以加入更智能的跨文件结果排序和去重逻辑
-            final_snippets = all_snippets[:self.top_k]
+            # 只需前 top_k 个，用堆选取（O(N log k)）而不是对全部片段排序；
+            # heapq.nlargest 与 sorted(..., reverse=True)[:k] 结果一致，同分时保持文件顺序和文件内的相关度顺序
+            ranked = heapq.nlargest(self.top_k, fused_snippets.values(), key=lambda fused: fused[0])
+            final_snippets = [snippet for _, snippet in ranked]
             context = "\n---\n".join([
                 f"来源文件: {res.get('document_name')}\n标题: {res.get('title', '无标题')}\n内容片段: {res.get('text', '')}"
                 for res in final_snippets
@@ -116,20 +230,7 @@ class RAGService:
             logger.debug(f"RAG: 构建的最终上下文 (前200字符): {context[:200]}...")
 
             # 4. 构建提示并生成答案
-            prompt = f"""
-你是一个智能助理。请根据以下从多个笔记文件中检索到的、最相关的上下文信息，来回答用户的问题。
-
-[上下文信息]
-{context}
-
-[用户问题]
-{query}
-
-请注意：
-- 请只根据提供的上下文信息进行回答，不要编造信息。
-- 如果上下文信息不足以回答问题，请明确告知用户"根据现有笔记，我无法回答这个问题"。
-- 你的回答应该简洁、清晰、并直接针对用户的问题。
-"""
+            prompt = _ANSWER_PROMPT_TEMPLATE.format(context=context, query=query)
             
             answer = await self.llm_service.chat(prompt)
             logger.info("RAG: 已成功生成回答。")
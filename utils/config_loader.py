@@ -5,16 +5,28 @@
 负责加载和验证配置文件
 """
 
-import json
 import os
+import re
+import copy
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Tuple
 from loguru import logger
-from dotenv import load_dotenv, find_dotenv
+
+from utils import json_utils
+
+
+# B站cookies中的SESSDATA，加载配置时提取一次
+_SESSDATA_PATTERN = re.compile(r'SESSDATA=([^;]+)')
 
 
 class ConfigLoader:
     """配置加载器"""
+
+    # 已解析的配置文件: {(配置文件绝对路径, 修改时间): 解析结果}。文件未变化时不再重复解析JSON；
+    # 环境变量覆盖、校验和默认值每次加载都基于缓存的深拷贝重新执行，环境变量变化后也能生效
+    _cache: Dict[Tuple[str, int], Dict[str, Any]] = {}
+    # find_dotenv 会逐级向上查找目录，只查找一次并记住找到的.env路径（空字符串表示不存在）
+    _dotenv_path: Optional[str] = None
     
     @staticmethod
     def load(config_path: Path) -> Dict[str, Any]:
@@ -22,13 +34,23 @@ class ConfigLoader:
         加载配置文件，并从环境变量中合并敏感信息。
         """
         # 步骤1: 加载.env文件，使其内容可用于os.getenv
-        load_dotenv(find_dotenv())
+        # 只在加载配置时用到，推迟导入 dotenv
+        from dotenv import load_dotenv, find_dotenv
+        if ConfigLoader._dotenv_path is None:
+            ConfigLoader._dotenv_path = find_dotenv()
+        if ConfigLoader._dotenv_path:
+            load_dotenv(ConfigLoader._dotenv_path)
         logger.info(".env文件已加载（如果存在）。")
         
         try:
-            # 步骤2: 从config.json加载基础配置
-            with open(config_path, 'r', encoding='utf-8') as f:
-                config = json.load(f)
+            # 步骤2: 从config.json加载基础配置，文件未变化时复用上次的解析结果
+            config_path = Path(config_path)
+            cache_key = (str(config_path.resolve()), config_path.stat().st_mtime_ns)
+            parsed = ConfigLoader._cache.get(cache_key)
+            if parsed is None:
+                parsed = json_utils.loads(config_path.read_bytes())
+                ConfigLoader._cache[cache_key] = parsed
+            config = copy.deepcopy(parsed)
             
             # 步骤3: 从环境变量覆盖或补充配置
             ConfigLoader._apply_env_vars(config)
@@ -46,7 +68,7 @@ class ConfigLoader:
             
         except FileNotFoundError:
             raise FileNotFoundError(f"配置文件不存在: {config_path}")
-        except json.JSONDecodeError as e:
+        except json_utils.JSONDecodeError as e:
             raise ValueError(f"配置文件格式错误: {e}")
         except Exception as e:
             raise Exception(f"加载配置文件失败: {e}")
@@ -73,6 +95,14 @@ class ConfigLoader:
             config['jina']['api_key'] = jina_key
             logger.info("已从环境变量加载 Jina API Key。")
 
+        # B站配置：从cookies中提取一次SESSDATA，使用方直接读取 bilibili.sessdata
+        bilibili_config = config.get('bilibili') or {}
+        cookies = bilibili_config.get('cookies')
+        if cookies and not bilibili_config.get('sessdata'):
+            match = _SESSDATA_PATTERN.search(cookies)
+            if match:
+                bilibili_config['sessdata'] = match.group(1)
+
         # 代理配置
         config.setdefault('proxy', {})
         proxy_url = os.getenv('HTTPS_PROXY') or os.getenv('https_proxy')
@@ -142,32 +172,19 @@ class ConfigLoader:
             'temperature': 0.7,
             'max_completion_tokens': 2000
         }
-        # 移除旧的 'proxy' 默认值，因为我们将它移到了独立的 'proxy' 配置段
-        if 'proxy' in openai_defaults:
-            del openai_defaults['proxy']
-
-        for key, value in openai_defaults.items():
-            if key not in config['openai']:
-                config['openai'][key] = value
+        # 各配置段以默认值为底、用户配置覆盖，一次字典合并完成，已有的键保持不变
+        config['openai'] = {**openai_defaults, **config['openai']}
         
         # 内容提取默认值
-        if 'content_extraction' not in config:
-            config['content_extraction'] = {}
-        
         extraction_defaults = {
             'context_time_window': 60,
             'auto_extract_enabled': True,
             'extract_types': ['wechat_article', 'bilibili_video', 'arxiv_paper', 'web_link'],
             'silent_mode': True
         }
-        for key, value in extraction_defaults.items():
-            if key not in config['content_extraction']:
-                config['content_extraction'][key] = value
+        config['content_extraction'] = {**extraction_defaults, **config.get('content_extraction', {})}
         
         # RAG默认值
-        if 'rag' not in config:
-            config['rag'] = {}
-        
         rag_defaults = {
             'enabled': True,
             'embedding_model': 'text-embedding-ada-002',
@@ -176,20 +193,13 @@ class ConfigLoader:
             'top_k': 5,
             'similarity_threshold': 0.7
         }
-        for key, value in rag_defaults.items():
-            if key not in config['rag']:
-                config['rag'][key] = value
+        config['rag'] = {**rag_defaults, **config.get('rag', {})}
         
         # 系统默认值
-        if 'system' not in config:
-            config['system'] = {}
-        
         system_defaults = {
             'log_level': 'INFO',
             'message_queue_size': 100,
             'auto_save_interval': 300,
             'timezone': 'Asia/Shanghai'
         }
-        for key, value in system_defaults.items():
-            if key not in config['system']:
-                config['system'][key] = value 
\ No newline at end of file
+        config['system'] = {**system_defaults, **config.get('system', {})}
@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+JSON工具
+优先使用C实现的 orjson 进行序列化/反序列化，未安装时回退到标准库 json。
+"""
+
+import json
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:
+    # orjson 为可选依赖，未安装时使用标准库
+    orjson = None
+
+# orjson.JSONDecodeError 是 json.JSONDecodeError 的子类，调用方统一捕获这个即可
+JSONDecodeError = json.JSONDecodeError
+
+
+def dumps(obj: Any) -> str:
+    """
+    序列化为JSON字符串（保留中文等非ASCII字符，不做转义）。
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+    return json.dumps(obj, ensure_ascii=False)
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    """
+    从JSON字符串或UTF-8字节串反序列化。
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
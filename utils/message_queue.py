@@ -6,7 +6,6 @@
 """
 
 import queue
-import threading
 from typing import Any, Optional
 from loguru import logger
 
@@ -22,7 +21,6 @@ class MessageQueue:
             max_size: 队列最大容量
         """
         self.queue = queue.Queue(maxsize=max_size)
-        self.lock = threading.Lock()
         
     def put(self, item: Any, block: bool = True, timeout: Optional[float] = None):
         """
@@ -35,7 +33,8 @@ class MessageQueue:
         """
         try:
             self.queue.put(item, block=block, timeout=timeout)
-            logger.debug(f"消息已加入队列，当前队列大小: {self.queue.qsize()}")
+            # 每次入队都会执行，惰性求值：未开启DEBUG日志时不取队列大小、不格式化字符串
+            logger.opt(lazy=True).debug("消息已加入队列，当前队列大小: {}", self.queue.qsize)
         except queue.Full:
             logger.warning("消息队列已满，丢弃消息")
     
@@ -69,9 +68,12 @@ class MessageQueue:
     
     def clear(self):
         """清空队列"""
-        with self.lock:
-            while not self.queue.empty():
-                try:
-                    self.queue.get_nowait()
-                except queue.Empty:
-                    break 
\ No newline at end of file
+        # 在 queue.Queue 自身的互斥锁内一次清空底层 deque，而不是逐个出队；
+        # 被清掉的项目视为已完成，并唤醒等待空位的生产者和等待 join() 的线程
+        with self.queue.mutex:
+            removed = len(self.queue.queue)
+            self.queue.queue.clear()
+            self.queue.unfinished_tasks -= removed
+            if self.queue.unfinished_tasks == 0:
+                self.queue.all_tasks_done.notify_all()
+            self.queue.not_full.notify_all() 
\ No newline at end of file
@@ -6,13 +6,119 @@
 """
 
 import sqlite3
-import json
 import time
 from datetime import datetime, timedelta
 from typing import Dict, Any, List, Optional
 from pathlib import Path
 from loguru import logger
+from collections import deque
 import threading
+import atexit
+
+from utils import json_utils
+
+
+# 连接建立时执行一次的PRAGMA：WAL模式下读不阻塞写，synchronous=NORMAL在WAL下
+# 仍能保证数据库一致性，只是断电时可能丢失最后几次提交；聊天记录可以接受这一点
+# auto_vacuum 只对尚未建表的新数据库生效，旧数据库保持原设置（此时 incremental_vacuum 不做任何事）
+_CONNECTION_PRAGMAS = (
+    "PRAGMA auto_vacuum=INCREMENTAL",
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-20000",
+)
+
+# 构建基本消息对象所需的列；extra_json 只在需要完整原始消息时才读取
+_MESSAGE_COLUMNS = "msg_id, from_user, to_user, user_nickname, content, msg_type, url, create_time"
+
+# 已由独立列原样保存的顶层消息字段及其列读回后的类型。类型一致的字段不再写入
+# extra_json，其余字段（以及类型不一致、读回会变样的字段）都保存在 extra_json 中
+_COLUMN_FIELD_TYPES = {
+    'MsgId': str,
+    'FromUserName': str,
+    'ToUserName': str,
+    'Text': str,
+    'Type': str,
+    'Url': str,
+    'CreateTime': int,
+}
+
+# extra_json 中记录原始消息缺少的列字段的键。保存时缺少的字段会以默认值写入对应的列，
+# 读回时据此删掉这些字段，使重建的消息与原始消息的键一致；'User.NickName' 表示 User 中没有 NickName
+_ABSENT_FIELDS_KEY = '__absent_fields__'
+
+_INSERT_MESSAGE_SQL = """
+    INSERT OR REPLACE INTO messages 
+    (msg_id, from_user, to_user, user_nickname, group_name,
+     content, msg_type, url, is_group, create_time, extra_json)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# 消息先进入内存缓冲，由后台线程批量写入：缓冲满 _WRITE_BATCH_SIZE 条立即写，
+# 否则最多等待 _WRITE_FLUSH_INTERVAL 秒
+_WRITE_BATCH_SIZE = 64
+_WRITE_FLUSH_INTERVAL = 0.5
+
+# 清理旧消息时每批删除的行数；分批删除可限制单个事务写入WAL的大小，批次之间释放锁，不阻塞写入
+_CLEANUP_BATCH_SIZE = 10000
+_CLEANUP_DELETE_SQL = """
+    DELETE FROM messages 
+    WHERE rowid IN (SELECT rowid FROM messages WHERE create_time < ? LIMIT ?)
+"""
+
+
+def _extra_fields(msg: Dict[str, Any], user_nickname: str) -> Dict[str, Any]:
+    """
+    返回消息中没有被独立列原样保存的字段，序列化后存入 extra_json。
+    User 中与 user_nickname 列相同的 NickName 也不重复保存。
+    消息中缺少的列字段记录在 _ABSENT_FIELDS_KEY 下，读回时不会凭空多出这些键。
+    """
+    extra = {}
+    absent = [key for key in _COLUMN_FIELD_TYPES if key not in msg]
+    user = msg.get('User')
+    if user is None and 'User' not in msg:
+        absent.append('User')
+    elif isinstance(user, dict) and 'NickName' not in user:
+        absent.append('User.NickName')
+    if absent:
+        extra[_ABSENT_FIELDS_KEY] = absent
+    for key, value in msg.items():
+        if type(value) is _COLUMN_FIELD_TYPES.get(key):
+            continue
+        if key == 'User' and isinstance(value, dict):
+            value = {k: v for k, v in value.items() if k != 'NickName' or v != user_nickname}
+            if not value:
+                continue
+        extra[key] = value
+    return extra
+
+
+def _row_to_message(row: sqlite3.Row, extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """由各列构建基本消息对象，再合并 extra_json 中的其余字段"""
+    message = {
+        'MsgId': row['msg_id'],
+        'FromUserName': row['from_user'],
+        'ToUserName': row['to_user'],
+        'User': {'NickName': row['user_nickname']},
+        'Text': row['content'],
+        'Type': row['msg_type'],
+        'Url': row['url'],
+        'CreateTime': row['create_time']
+    }
+    if extra:
+        absent = extra.pop(_ABSENT_FIELDS_KEY, ())
+        user_extra = extra.get('User')
+        message.update(extra)
+        if isinstance(user_extra, dict):
+            message['User'] = {'NickName': row['user_nickname'], **user_extra}
+        for key in absent:
+            if key == 'User.NickName':
+                if isinstance(message.get('User'), dict):
+                    message['User'].pop('NickName', None)
+            else:
+                message.pop(key, None)
+    return message
 
 
 class MessageStorage:
@@ -28,18 +134,32 @@ class MessageStorage:
         self.db_path = Path(db_path)
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
         
-        # 线程锁，确保并发安全
+        # 线程锁，确保并发安全；所有线程共用同一个连接，读写都需持锁
         self.lock = threading.Lock()
         
+        # 长连接，避免每次读写都重新打开数据库文件。
+        # isolation_level=None 为自动提交模式，每条语句执行完即提交
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        for pragma in _CONNECTION_PRAGMAS:
+            self._conn.execute(pragma)
+        
         # 初始化数据库
         self._init_db()
         
+        # 待写入的消息行，以及通知后台线程立即写入的事件
+        self._write_buf = deque()
+        self._flush_evt = threading.Event()
+        self._closed = False
+        self._writer = threading.Thread(target=self._writer_loop, name="MessageStorageWriter", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+        
         logger.info(f"消息存储初始化成功: {self.db_path}")
     
     def _init_db(self):
         """初始化数据库表"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
+        with self.lock:
+            cursor = self._conn.cursor()
             
             # 创建消息表
             cursor.execute("""
@@ -55,81 +175,120 @@ class MessageStorage:
                     url TEXT,
                     is_group BOOLEAN,
                     create_time INTEGER,
-                    raw_data TEXT,
+                    extra_json TEXT,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
             """)
             
+            # 旧版数据库把完整消息重复保存在 raw_data 列中：补上 extra_json 列，
+            # 新写入的消息不再填 raw_data，已有消息仍从 raw_data 读取
+            columns = {info[1] for info in cursor.execute("PRAGMA table_info(messages)")}
+            if 'extra_json' not in columns:
+                cursor.execute("ALTER TABLE messages ADD COLUMN extra_json TEXT")
+            self._has_raw_data = 'raw_data' in columns
+            
             # 创建索引
             cursor.execute("""
                 CREATE INDEX IF NOT EXISTS idx_create_time 
                 ON messages(create_time)
             """)
             
+            # 按群组/用户筛选的查询同时带有时间范围，复合索引可以直接做范围扫描；
+            # 它们的最左列也能服务只按群组/用户的查询，旧的单列索引不再需要
+            cursor.execute("DROP INDEX IF EXISTS idx_group_name")
+            cursor.execute("DROP INDEX IF EXISTS idx_user_nickname")
+            
             cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_group_name 
-                ON messages(group_name)
+                CREATE INDEX IF NOT EXISTS idx_group_time 
+                ON messages(group_name, create_time)
             """)
             
             cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_user_nickname 
-                ON messages(user_nickname)
+                CREATE INDEX IF NOT EXISTS idx_user_time 
+                ON messages(user_nickname, create_time)
             """)
             
-            conn.commit()
+            # 更新查询规划器的统计信息（仅在需要时才会真正执行ANALYZE）
+            cursor.execute("PRAGMA optimize")
     
     def save_message(self, msg: Dict[str, Any]):
         """
-        保存消息到数据库
+        保存消息到数据库。消息先放入写缓冲，由后台线程批量写入；
+        之后的查询会先写入缓冲中的消息，因此总能查到已保存的消息。
         
         Args:
             msg: 微信消息对象
         """
         try:
-            with self.lock:
-                # 提取消息信息
-                msg_id = msg.get('MsgId', str(time.time()))
-                from_user = msg.get('FromUserName', '')
-                to_user = msg.get('ToUserName', '')
-                user_nickname = msg.get('User', {}).get('NickName', '')
-                content = msg.get('Text', '')
-                msg_type = msg.get('Type', '')
-                url = msg.get('Url', '')
-                is_group = from_user.startswith('@@')
-                create_time = msg.get('CreateTime', int(time.time()))
-                
-                # 群组名称
-                group_name = ''
-                if is_group:
-                    group_name = msg.get('User', {}).get('NickName', '')
-                
-                # 序列化原始数据
-                raw_data = json.dumps(msg, ensure_ascii=False)
-                
-                with sqlite3.connect(self.db_path) as conn:
-                    cursor = conn.cursor()
-                    
-                    cursor.execute("""
-                        INSERT OR REPLACE INTO messages 
-                        (msg_id, from_user, to_user, user_nickname, group_name,
-                         content, msg_type, url, is_group, create_time, raw_data)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    """, (
-                        msg_id, from_user, to_user, user_nickname, group_name,
-                        content, msg_type, url, is_group, create_time, raw_data
-                    ))
-                    
-                    conn.commit()
-                    
-                logger.debug(f"消息已保存: {msg_id} from {user_nickname}")
-                
+            # 提取消息信息
+            msg_id = msg.get('MsgId', str(time.time()))
+            from_user = msg.get('FromUserName', '')
+            to_user = msg.get('ToUserName', '')
+            user_nickname = msg.get('User', {}).get('NickName', '')
+            content = msg.get('Text', '')
+            msg_type = msg.get('Type', '')
+            url = msg.get('Url', '')
+            is_group = from_user.startswith('@@')
+            create_time = msg.get('CreateTime', int(time.time()))
+            
+            # 群组名称
+            group_name = ''
+            if is_group:
+                group_name = msg.get('User', {}).get('NickName', '')
+            
+            # 只序列化独立列之外的字段
+            extra = _extra_fields(msg, user_nickname)
+            extra_json = json_utils.dumps(extra) if extra else None
+            
+            self._write_buf.append((
+                msg_id, from_user, to_user, user_nickname, group_name,
+                content, msg_type, url, is_group, create_time, extra_json
+            ))
+            if len(self._write_buf) >= _WRITE_BATCH_SIZE:
+                self._flush_evt.set()
+            
+            logger.debug(f"消息已加入写入队列: {msg_id} from {user_nickname}")
+            
         except Exception as e:
             logger.error(f"保存消息失败: {e}", exc_info=True)
     
+    def _writer_loop(self):
+        """后台写入线程：定期或在缓冲满时批量写入消息"""
+        while not self._closed:
+            self._flush_evt.wait(_WRITE_FLUSH_INTERVAL)
+            self._flush_evt.clear()
+            self._flush()
+    
+    def _flush(self):
+        """在一个事务中写入缓冲中的全部消息"""
+        with self.lock:
+            if not self._write_buf:
+                return
+            rows = [self._write_buf.popleft() for _ in range(len(self._write_buf))]
+            try:
+                self._conn.execute("BEGIN")
+                self._conn.executemany(_INSERT_MESSAGE_SQL, rows)
+                self._conn.execute("COMMIT")
+            except Exception as e:
+                if self._conn.in_transaction:
+                    self._conn.execute("ROLLBACK")
+                logger.warning(f"批量写入 {len(rows)} 条消息失败，改为逐条写入: {e}")
+                self._insert_rows_one_by_one(rows)
+    
+    def _insert_rows_one_by_one(self, rows: List[tuple]):
+        """逐条写入消息（自动提交），只丢弃无法写入的那一条。调用方需持有 self.lock"""
+        for row in rows:
+            try:
+                self._conn.execute(_INSERT_MESSAGE_SQL, row)
+            except Exception as e:
+                logger.error(f"保存消息失败: {row[0]}: {e}", exc_info=True)
+    
     def get_messages_in_time_window(self, target_time: int, 
                                    window_seconds: int = 60,
                                    group_name: Optional[str] = None,
-                                   user_nickname: Optional[str] = None) -> List[Dict[str, Any]]:
+                                   user_nickname: Optional[str] = None,
+                                   limit: Optional[int] = None,
+                                   return_raw: bool = True) -> List[Dict[str, Any]]:
         """
         获取指定时间窗口内的消息
         
@@ -138,61 +297,74 @@ class MessageStorage:
             window_seconds: 时间窗口（秒）
             group_name: 群组名称筛选
             user_nickname: 用户昵称筛选
+            limit: 只返回窗口内最新的若干条消息，None 表示不限制
+            return_raw: 是否返回完整的原始消息；为 False 时不读取 extra_json 列，
+                只返回由各列构建的基本消息对象
             
         Returns:
-            消息列表
+            消息列表，按时间升序
         """
         try:
             start_time = target_time - window_seconds
             end_time = target_time + window_seconds
+            self._flush()
             
-            with sqlite3.connect(self.db_path) as conn:
-                conn.row_factory = sqlite3.Row
-                cursor = conn.cursor()
-                
-                # 构建查询
-                query = """
-                    SELECT * FROM messages 
-                    WHERE create_time >= ? AND create_time <= ?
-                """
-                params = [start_time, end_time]
-                
-                # 添加筛选条件
-                if group_name:
-                    query += " AND group_name = ?"
-                    params.append(group_name)
-                
-                if user_nickname:
-                    query += " AND user_nickname = ?"
-                    params.append(user_nickname)
-                
+            # 构建查询
+            columns = _MESSAGE_COLUMNS
+            if return_raw:
+                columns += ", extra_json, raw_data" if self._has_raw_data else ", extra_json"
+            query = f"""
+                SELECT {columns} FROM messages 
+                WHERE create_time >= ? AND create_time <= ?
+            """
+            params = [start_time, end_time]
+            
+            # 添加筛选条件
+            if group_name:
+                query += " AND group_name = ?"
+                params.append(group_name)
+            
+            if user_nickname:
+                query += " AND user_nickname = ?"
+                params.append(user_nickname)
+            
+            if limit is not None:
+                # 取最新的 limit 条，返回前再恢复为升序
+                query += " ORDER BY create_time DESC LIMIT ?"
+                params.append(limit)
+            else:
                 query += " ORDER BY create_time ASC"
-                
+            
+            with self.lock:
+                cursor = self._conn.cursor()
+                cursor.row_factory = sqlite3.Row
                 cursor.execute(query, params)
                 rows = cursor.fetchall()
-                
-                # 转换为消息对象列表
-                messages = []
-                for row in rows:
+            if limit is not None:
+                rows.reverse()
+            
+            # 转换为消息对象列表
+            messages = []
+            for row in rows:
+                if return_raw and self._has_raw_data and row['raw_data']:
                     try:
-                        # 反序列化原始数据
-                        raw_data = json.loads(row['raw_data'])
-                        messages.append(raw_data)
-                    except:
-                        # 如果原始数据解析失败，构建基本消息对象
-                        messages.append({
-                            'MsgId': row['msg_id'],
-                            'FromUserName': row['from_user'],
-                            'ToUserName': row['to_user'],
-                            'User': {'NickName': row['user_nickname']},
-                            'Text': row['content'],
-                            'Type': row['msg_type'],
-                            'Url': row['url'],
-                            'CreateTime': row['create_time']
-                        })
+                        # 旧版数据库中的消息，raw_data 保存了完整的原始消息
+                        messages.append(json_utils.loads(row['raw_data']))
+                        continue
+                    except (ValueError, TypeError):
+                        # 原始数据解析失败时，退回到由各列构建消息对象
+                        pass
                 
-                logger.info(f"获取到 {len(messages)} 条消息 (时间窗口: {window_seconds}秒)")
-                return messages
+                extra = None
+                if return_raw and row['extra_json']:
+                    try:
+                        extra = json_utils.loads(row['extra_json'])
+                    except json_utils.JSONDecodeError:
+                        logger.warning(f"消息 {row['msg_id']} 的附加字段解析失败，仅返回基本字段")
+                messages.append(_row_to_message(row, extra))
+            
+            logger.info(f"获取到 {len(messages)} 条消息 (时间窗口: {window_seconds}秒)")
+            return messages
                 
         except Exception as e:
             logger.error(f"查询消息失败: {e}", exc_info=True)
@@ -228,17 +400,26 @@ class MessageStorage:
         """
         try:
             cutoff_time = int(time.time()) - (days * 24 * 3600)
+            self._flush()
             
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                cursor.execute("""
-                    DELETE FROM messages 
-                    WHERE create_time < ?
-                """, (cutoff_time,))
-                
-                deleted_count = cursor.rowcount
-                conn.commit()
+            deleted_count = 0
+            while True:
+                with self.lock:
+                    batch_count = self._conn.execute(
+                        _CLEANUP_DELETE_SQL, (cutoff_time, _CLEANUP_BATCH_SIZE)
+                    ).rowcount
+                    if batch_count:
+                        # 及时把已提交的删除写回数据库文件，避免WAL无限增长
+                        self._conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+                deleted_count += batch_count
+                if batch_count < _CLEANUP_BATCH_SIZE:
+                    break
+            
+            if deleted_count:
+                # 归还删除后空闲的页（仅对 auto_vacuum=INCREMENTAL 的数据库有效）
+                with self.lock:
+                    # 通过 execute 执行该PRAGMA只会释放一页，executescript 才会执行到底
+                    self._conn.executescript("PRAGMA incremental_vacuum;")
                 
             logger.info(f"清理了 {deleted_count} 条旧消息")
             
@@ -248,9 +429,19 @@ class MessageStorage:
     def get_message_count(self) -> int:
         """获取消息总数"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute("SELECT COUNT(*) FROM messages")
-                return cursor.fetchone()[0]
+            self._flush()
+            with self.lock:
+                return self._conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
         except:
-            return 0 
\ No newline at end of file
+            return 0
+    
+    def close(self):
+        """停止后台写入线程，写入剩余消息后关闭数据库连接"""
+        if self._closed:
+            return
+        self._closed = True
+        self._flush_evt.set()
+        self._writer.join()
+        self._flush()
+        with self.lock:
+            self._conn.close() 
\ No newline at end of file
@@ -8,10 +8,19 @@
 import re
 import json
 import asyncio
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, TYPE_CHECKING
 from loguru import logger
-import aiohttp
-from bilibili_api import video, Credential
+
+from utils.config_loader import _SESSDATA_PATTERN
+
+# bilibili_api 和 aiohttp 导入较慢，且只有遇到B站链接时才会用到，推迟到首次使用时再导入
+if TYPE_CHECKING:
+    from bilibili_api import video
+
+
+# BV号。标准视频页（bilibili.com/video/BV...）和短链接（b23.tv/BV...）中的BV号同样能被它匹配到。
+# BV号只由ASCII字母和数字组成，不用 \w，以免把紧随其后的下划线或中文一并匹配进来
+_BVID_PATTERN = re.compile(r'BV[0-9A-Za-z]+')
 
 
 class BilibiliSummarizer:
@@ -22,7 +31,7 @@ class BilibiliSummarizer:
         初始化B站视频总结器
         
         Args:
-            config: B站相关配置
+            config: B站相关配置（经 ConfigLoader 加载时已包含从cookies中提取的 sessdata）
         """
         self.config = config
         self.cookies = config.get('cookies', '')
@@ -30,18 +39,19 @@ class BilibiliSummarizer:
         
         # 初始化凭证（如果有）
         self.credential = None
-        if self.cookies:
+        if self.cookies or config.get('sessdata'):
             try:
-                # 解析cookies
-                sessdata = self._extract_sessdata(self.cookies)
+                # 优先使用加载配置时已提取的SESSDATA，否则解析cookies
+                sessdata = config.get('sessdata') or self._extract_sessdata(self.cookies)
                 if sessdata:
+                    from bilibili_api import Credential
                     self.credential = Credential(sessdata=sessdata)
             except Exception as e:
                 logger.warning(f"解析B站cookies失败: {e}")
     
     def _extract_sessdata(self, cookies: str) -> Optional[str]:
         """从cookies字符串中提取SESSDATA"""
-        match = re.search(r'SESSDATA=([^;]+)', cookies)
+        match = _SESSDATA_PATTERN.search(cookies)
         return match.group(1) if match else None
     
     async def get_video_info(self, url: str) -> Optional[Dict[str, Any]]:
@@ -54,6 +64,8 @@ class BilibiliSummarizer:
         Returns:
             视频信息字典
         """
+        from bilibili_api import video
+        
         try:
             # 提取视频ID
             bvid = self._extract_bvid(url)
@@ -93,19 +105,10 @@ class BilibiliSummarizer:
     
     def _extract_bvid(self, url: str) -> Optional[str]:
         """从URL中提取BV号"""
-        # 支持多种URL格式
-        patterns = [
-            r'BV[\w]+',  # 直接的BV号
-            r'bilibili\.com/video/(BV[\w]+)',  # 标准视频页
-            r'b23\.tv/(BV[\w]+)',  # 短链接
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, url)
-            if match:
-                return match.group(1) if '(' in pattern else match.group()
-        
-        return None
+        # 支持直接的BV号、标准视频页和短链接；原先按格式逐个尝试的几个正则中，
+        # 第一个（裸BV号）已能匹配所有格式，因此只需一次搜索
+        match = _BVID_PATTERN.search(url)
+        return match.group() if match else None
     
     def _format_duration(self, seconds: int) -> str:
         """格式化时长"""
@@ -118,7 +121,7 @@ class BilibiliSummarizer:
         else:
             return f"{minutes}:{secs:02d}"
     
-    async def _get_transcript(self, v: video.Video) -> str:
+    async def _get_transcript(self, v: 'video.Video') -> str:
         """
         获取视频字幕
         
@@ -150,6 +153,7 @@ class BilibiliSummarizer:
                 # 获取字幕内容
                 subtitle_url = chinese_subtitle.get('subtitle_url', '')
                 if subtitle_url:
+                    import aiohttp
                     async with aiohttp.ClientSession() as session:
                         async with session.get(subtitle_url) as response:
                             subtitle_data = await response.json()
@@ -182,6 +186,8 @@ class BilibiliSummarizer:
         if not self.summarizer_api:
             return None
         
+        import aiohttp
+        
         try:
             # 调用外部总结API
             async with aiohttp.ClientSession() as session: